@@ -0,0 +1,126 @@
+import math
+
+from db import LOCAL_HOST
+
+# пороги по умолчанию: метрика -> (порог, сколько секунд он должен держаться); None — без порога
+DEFAULT_THRESHOLDS = {
+    "cpu": (90.0, 60.0),
+    "memory": (90.0, 60.0),
+    "gpu": (95.0, 60.0),
+    "network_kb": (None, 60.0),
+}
+DEFAULT_ALPHA = 0.05
+DEFAULT_Z = 4.0
+# сколько показаний нужно EWMA, прежде чем отклонения начнут считаться аномалиями
+WARMUP = 30
+
+
+class MetricDetector:
+    """Онлайн-детектор для одного ряда: EWMA среднего и дисперсии плюс окно устойчивого превышения порога.
+
+    Состояние — несколько чисел, обработка показания — O(1). Оповещение
+    выдаётся один раз при входе в аномальное состояние, а не на каждом
+    показании, пока оно длится.
+    """
+
+    __slots__ = ("alpha", "z_limit", "threshold", "duration", "count", "mean", "var",
+                 "anomalous", "above_since", "sustained")
+
+    def __init__(self, threshold=None, duration=60.0, alpha=DEFAULT_ALPHA, z_limit=DEFAULT_Z):
+        self.alpha = alpha
+        self.z_limit = z_limit
+        self.threshold = threshold
+        self.duration = duration
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.anomalous = False
+        self.above_since = None
+        self.sustained = False
+
+    def update(self, timestamp, value):
+        """:return: Список пар (вид, описание) новых оповещений — обычно пустой"""
+        events = []
+
+        if self.count >= WARMUP and self.var > 0:
+            z = (value - self.mean) / math.sqrt(self.var)
+            is_anomaly = abs(z) > self.z_limit
+            if is_anomaly and not self.anomalous:
+                events.append(("anomaly", f"резкое отклонение: {value:.1f} при среднем {self.mean:.1f} (z={z:.1f})"))
+            self.anomalous = is_anomaly
+
+        delta = value - self.mean
+        self.mean += self.alpha * delta
+        self.var = (1 - self.alpha) * (self.var + self.alpha * delta * delta)
+        self.count += 1
+
+        if self.threshold is not None:
+            if value >= self.threshold:
+                if self.above_since is None:
+                    self.above_since = timestamp
+                if not self.sustained and timestamp - self.above_since >= self.duration:
+                    self.sustained = True
+                    events.append(("threshold", f"выше {self.threshold:g} дольше {self.duration:g} с: {value:.1f}"))
+            else:
+                self.above_since = None
+                self.sustained = False
+        return events
+
+
+class AnomalyDetector:
+    """Набор MetricDetector по каждой паре (хост, метрика) с порогами из user_settings"""
+
+    def __init__(self, thresholds=None, alpha=DEFAULT_ALPHA, z_limit=DEFAULT_Z):
+        self.thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+        self.alpha = alpha
+        self.z_limit = z_limit
+        self._detectors = {}
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        :param settings: Результат SQLiteHandler.fetch_settings(). Используются настройки
+                         alert_<метрика> (порог), alert_<метрика>_duration (секунды),
+                         alert_alpha и alert_z; некорректные значения пропускаются.
+        """
+        values = {}
+        for setting in settings:
+            try:
+                values[setting["name"]] = float(setting["value"])
+            except (TypeError, ValueError):
+                continue
+
+        thresholds = {}
+        for metric, (threshold, duration) in DEFAULT_THRESHOLDS.items():
+            thresholds[metric] = (
+                values.get(f"alert_{metric}", threshold),
+                values.get(f"alert_{metric}_duration", duration),
+            )
+        return cls(thresholds, values.get("alert_alpha", DEFAULT_ALPHA), values.get("alert_z", DEFAULT_Z))
+
+    def process(self, timestamp, row, host=LOCAL_HOST):
+        """
+        :param row: Строка показаний: {"cpu": ..., "memory": ..., "gpu": ..., "network_kb": ...}
+        :return: Список оповещений в формате SQLiteHandler.insert_alerts
+        """
+        alerts = []
+        for metric in self.thresholds:
+            value = row.get(metric)
+            if value is None:
+                continue
+            detector = self._detectors.get((host, metric))
+            if detector is None:
+                threshold, duration = self.thresholds[metric]
+                detector = self._detectors[(host, metric)] = MetricDetector(
+                    threshold, duration, self.alpha, self.z_limit
+                )
+            for kind, message in detector.update(timestamp, value):
+                alerts.append({
+                    "time": int(timestamp),
+                    "host": host,
+                    "metric": metric,
+                    "kind": kind,
+                    "value": value,
+                    "message": message,
+                })
+        return alerts
@@ -0,0 +1,83 @@
+import struct
+import zlib
+
+import numpy as np
+
+# Блок архива — показания одного хоста за закрытый интервал времени, сжатые в один BLOB:
+#   время — первое значение, первая разность и далее разности разностей (при опросе
+#           с постоянным шагом это почти сплошные нули);
+#   метрики — значения, округлённые до 1 / QUANT и записанные разностями соседних,
+#             а за каждой — номера показаний с пустым значением (NULL в БД), тоже разностями
+#             (с версии 2; обычно пустой ряд).
+# Каждый ряд хранится в самом узком целочисленном типе, в который помещается,
+# а весь блок дополнительно сжимается zlib.
+VERSION = 2
+QUANT = 100  # точность хранения метрик — сотые доли
+HEADER = struct.Struct("<BIqq")  # версия, число показаний, первое время, первая разность времени
+SERIES = struct.Struct("<BI")  # код типа, длина в байтах
+DTYPES = ("<i1", "<i2", "<i4", "<i8")
+COMPRESSION_LEVEL = 6
+
+
+def _pack_series(values):
+    for code, dtype in enumerate(DTYPES):
+        info = np.iinfo(dtype)
+        if not len(values) or (values.min() >= info.min and values.max() <= info.max):
+            data = values.astype(dtype).tobytes()
+            return SERIES.pack(code, len(data)) + data
+    raise ValueError("Значение не помещается в int64")
+
+
+def _unpack_series(payload, offset):
+    code, length = SERIES.unpack_from(payload, offset)
+    offset += SERIES.size
+    values = np.frombuffer(payload, dtype=DTYPES[code], count=length // np.dtype(DTYPES[code]).itemsize,
+                           offset=offset)
+    return values.astype(np.int64), offset + length
+
+
+def encode_block(times, columns):
+    """
+    :param times: Отсортированные по возрастанию секунды эпохи
+    :param columns: {метрика: значения} той же длины, порядок ключей сохраняется в блоке
+    :return: Сжатый блок
+    """
+    times = np.asarray(times, dtype=np.int64)
+    count = len(times)
+    if not count:
+        raise ValueError("Пустой блок")
+    deltas = np.diff(times)
+    first_delta = int(deltas[0]) if len(deltas) else 0
+    parts = [HEADER.pack(VERSION, count, int(times[0]), first_delta), _pack_series(np.diff(deltas))]
+    for name, values in columns.items():
+        values = np.asarray(values, dtype=np.float64)
+        nulls = np.isnan(values)
+        if np.isinf(values).any():
+            raise ValueError(f"Бесконечное значение в {name}")
+        # пустые значения заменяются нулями, а их номера записываются отдельным рядом
+        quantized = np.rint(np.where(nulls, 0.0, values) * QUANT).astype(np.int64)
+        parts.append(_pack_series(np.diff(quantized, prepend=0)))
+        parts.append(_pack_series(np.diff(np.flatnonzero(nulls), prepend=0)))
+    return zlib.compress(b"".join(parts), COMPRESSION_LEVEL)
+
+
+def decode_block(blob, names):
+    """
+    :param names: Имена метрик в том порядке, в котором они записаны
+    :return: (times int64, {метрика: значения float64}); пустые значения — NaN
+    """
+    payload = zlib.decompress(blob)
+    version, count, first_time, first_delta = HEADER.unpack_from(payload)
+    if version not in (1, VERSION):
+        raise ValueError(f"Неподдерживаемая версия блока архива: {version}")
+    dod, offset = _unpack_series(payload, HEADER.size)
+    deltas = np.cumsum(np.concatenate([[first_delta], dod]))[:count - 1]
+    times = first_time + np.concatenate([[0], np.cumsum(deltas)]).astype(np.int64)
+    columns = {}
+    for name in names:
+        deltas, offset = _unpack_series(payload, offset)
+        columns[name] = np.cumsum(deltas) / QUANT
+        if version >= 2:
+            nulls, offset = _unpack_series(payload, offset)
+            columns[name][np.cumsum(nulls)] = np.nan
+    return times, columns
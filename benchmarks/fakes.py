@@ -0,0 +1,115 @@
+from collections import namedtuple
+
+import components
+
+_CpuTimes = namedtuple("scputimes", "user system idle")
+_Freq = namedtuple("scpufreq", "current min max")
+_VirtualMemory = namedtuple("svmem", "total available percent used free")
+_DiskUsage = namedtuple("sdiskusage", "total used free percent")
+_NetIO = namedtuple("snetio", "bytes_sent bytes_recv packets_sent packets_recv errin errout dropin dropout")
+_DiskIO = namedtuple("sdiskio", "read_count write_count read_bytes write_bytes read_time write_time")
+_MemInfo = namedtuple("pmem", "rss vms")
+
+
+class FakeProcess:
+    """Процесс с детерминированными счётчиками вместо psutil.Process"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.tick = 0
+
+    def oneshot(self):
+        return _NullContext()
+
+    def cpu_percent(self, interval=None):
+        self.tick += 1
+        return float((self.pid * 7 + self.tick) % 100)
+
+    def memory_info(self):
+        return _MemInfo(rss=(self.pid % 500 + 1) * 2 ** 20, vms=0)
+
+    def name(self):
+        return f"proc-{self.pid}"
+
+
+class _NullContext:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakePsutil:
+    """Детерминированная подмена функций psutil, импортированных в components"""
+
+    def __init__(self, cores=8, processes=300, disks=2, nics=2):
+        self.cores = cores
+        self.processes = processes
+        self.disks = disks
+        self.nics = nics
+        self.tick = 0
+
+    def cpu_times(self, percpu=False):
+        self.tick += 1
+        if percpu:
+            return [self._cpu_times(self.tick + i * 13) for i in range(self.cores)]
+        return self._cpu_times(self.tick)
+
+    @staticmethod
+    def _cpu_times(tick):
+        # за тик проходит 100 единиц времени, занятых из них около половины
+        busy = 50 * tick + tick % 7
+        return _CpuTimes(user=float(busy), system=0.0, idle=float(100 * tick - busy))
+
+    def cpu_freq(self):
+        return _Freq(current=2400.0, min=800.0, max=3600.0)
+
+    def cpu_count(self, logical=True):
+        return self.cores if logical else self.cores // 2
+
+    def virtual_memory(self):
+        return _VirtualMemory(total=16 * 2 ** 30, available=8 * 2 ** 30, percent=50.0 + self.tick % 10,
+                              used=8 * 2 ** 30, free=8 * 2 ** 30)
+
+    def disk_usage(self, path):
+        return _DiskUsage(total=500 * 2 ** 30, used=200 * 2 ** 30, free=300 * 2 ** 30, percent=40.0)
+
+    def disk_io_counters(self, perdisk=False):
+        counters = {
+            f"sd{chr(ord('a') + i)}": _DiskIO(self.tick * 5, self.tick * 3, self.tick * 40_960, self.tick * 8_192, 0, 0)
+            for i in range(self.disks)
+        }
+        return counters if perdisk else next(iter(counters.values()))
+
+    def net_io_counters(self, pernic=False):
+        sent = self.tick * 10_000
+        counters = {
+            f"eth{i}": _NetIO(sent, sent * 3, self.tick * 10, self.tick * 30, 0, 0, 0, 0) for i in range(self.nics)
+        }
+        return counters if pernic else next(iter(counters.values()))
+
+    def pids(self):
+        return list(range(1, self.processes + 1))
+
+    def install(self):
+        """Подменяет функции psutil в модуле components; возвращает словарь исходных значений"""
+        names = ["cpu_times", "cpu_freq", "cpu_count", "virtual_memory", "disk_usage", "disk_io_counters",
+                 "net_io_counters", "pids"]
+        originals = {name: getattr(components, name) for name in names + ["Process"]}
+        for name in names:
+            setattr(components, name, getattr(self, name))
+        components.Process = FakeProcess
+        return originals
+
+    @staticmethod
+    def uninstall(originals):
+        for name, value in originals.items():
+            setattr(components, name, value)
+
+
+def fake_monitor():
+    """SystemMonitor, работающий целиком на подменённых psutil и FakeGPUBackend"""
+    monitor = components.SystemMonitor()
+    monitor.gpu = components.GPU(components.FakeGPUBackend())
+    return monitor
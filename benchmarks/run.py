@@ -0,0 +1,335 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np  # noqa: E402
+
+from benchmarks.fakes import FakePsutil, fake_monitor  # noqa: E402
+
+HISTORY_SIZE = 1_000_000
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Регистрирует функцию замера; она получает (scale, workdir) и возвращает словарь метрик"""
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def measure(func, repeat):
+    """Время каждого из repeat вызовов func в секундах"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def latency(samples):
+    samples = sorted(samples)
+    return {
+        "mean_ms": statistics.fmean(samples) * 1e3,
+        "p50_ms": samples[len(samples) // 2] * 1e3,
+        "p95_ms": samples[min(int(len(samples) * 0.95), len(samples) - 1)] * 1e3,
+        "max_ms": samples[-1] * 1e3,
+    }
+
+
+def rate(count, seconds):
+    return count / seconds if seconds else float("inf")
+
+
+def synthetic_history(count):
+    times = np.arange(count, dtype=np.int64) + 1_700_000_000
+    phase = np.linspace(0, 200 * np.pi, count)
+    columns = {
+        "cpu": 50 + 40 * np.sin(phase),
+        "memory": 60 + 10 * np.cos(phase / 7),
+        "gpu": 30 + 30 * np.sin(phase / 3),
+        "network_kb": np.abs(500 * np.sin(phase * 5)),
+    }
+    return times, columns
+
+
+@benchmark("sampling")
+def bench_sampling(scale, workdir):
+    fake = FakePsutil()
+    originals = fake.install()
+    try:
+        monitor = fake_monitor()
+        ticks = max(int(500 * scale), 10)
+        monitor.get_all_usage()
+        sequential = measure(monitor.get_all_usage, ticks)
+        concurrent = measure(lambda: monitor.get_all_usage(timeout=1.0), ticks)
+        monitor.close()
+    finally:
+        FakePsutil.uninstall(originals)
+    return {
+        "ticks": ticks,
+        "tick_sequential": latency(sequential),
+        "tick_concurrent": latency(concurrent),
+    }
+
+
+@benchmark("storage")
+def bench_storage(scale, workdir):
+    from db import SQLiteHandler
+
+    previous = SQLiteHandler.DB_FILE
+    SQLiteHandler.DB_FILE = os.path.join(workdir, "bench.db")
+    try:
+        SQLiteHandler.init_db()
+        times, columns = synthetic_history(max(int(200_000 * scale), 1000))
+        rows = [
+            {"time": int(t), "cpu": c, "memory": m, "gpu": g, "network_kb": n}
+            for t, c, m, g, n in zip(times.tolist(), *(columns[k].tolist() for k in columns))
+        ]
+
+        single = rows[:max(int(2000 * scale), 100)]
+        start = time.perf_counter()
+        for row in single:
+            SQLiteHandler.insert_usage(row)
+        single_seconds = time.perf_counter() - start
+
+        batch_size = 500
+        start = time.perf_counter()
+        for i in range(0, len(rows), batch_size):
+            SQLiteHandler.insert_usage_many(rows[i:i + batch_size])
+        batch_seconds = time.perf_counter() - start
+
+        end = int(times[-1]) + 1
+        start = time.perf_counter()
+        hour = sum(1 for _ in SQLiteHandler.fetch_usage_range(end - 3600, end))
+        range_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        buckets = sum(1 for _ in SQLiteHandler.fetch_rollup_range("1m", 0, end))
+        rollup_seconds = time.perf_counter() - start
+
+        # синтетические отметки времени давно прошли — весь ряд уходит в архив
+        conn = SQLiteHandler.get_connection()
+        start = time.perf_counter()
+        archived = SQLiteHandler.prune_usage(0)
+        archive_seconds = time.perf_counter() - start
+        archive_bytes = conn.execute("SELECT sum(length(data)) FROM usage_archive").fetchone()[0]
+        start = time.perf_counter()
+        read = sum(len(times) for times, _ in SQLiteHandler.fetch_archive_blocks(0, end))
+        archive_read_seconds = time.perf_counter() - start
+        SQLiteHandler.close_connection()
+    finally:
+        SQLiteHandler.DB_FILE = previous
+    return {
+        "insert_single_per_sec": rate(len(single), single_seconds),
+        "insert_batched_per_sec": rate(len(rows), batch_seconds),
+        "batch_size": batch_size,
+        "range_last_hour_ms": range_seconds * 1e3,
+        "range_last_hour_rows": hour,
+        "rollup_1m_scan_ms": rollup_seconds * 1e3,
+        "rollup_1m_rows": buckets,
+        "archived_rows": archived,
+        "archive_per_sec": rate(archived, archive_seconds),
+        "archive_bytes_per_sample": archive_bytes / max(archived, 1),
+        "archive_read_per_sec": rate(read, archive_read_seconds),
+    }
+
+
+@benchmark("rendering")
+def bench_rendering(scale, workdir):
+    from PyQt6.QtWidgets import QApplication
+    from main import PLOT_WINDOW, LivePlot
+    from ringbuffer import SampleBuffer
+
+    app = QApplication.instance() or QApplication([])
+    plot = LivePlot("bench", "%")
+    plot.resize(800, 300)
+    plot.show()
+    app.processEvents()
+    plot.canvas.draw()
+
+    buffer = SampleBuffer(PLOT_WINDOW * 10)
+    values = iter(np.tile(np.linspace(10, 90, 97), 1000))
+    frames = max(int(300 * scale), 10)
+
+    def blit_frame():
+        buffer.append(0, {"cpu": next(values)})
+        plot.update_plot(buffer.column("cpu", PLOT_WINDOW))
+
+    def full_frame():
+        blit_frame()
+        plot.canvas.draw()
+
+    blit = measure(blit_frame, frames)
+    full = measure(full_frame, max(frames // 5, 5))
+    history = synthetic_history(HISTORY_SIZE)[1]["cpu"]
+    set_data = measure(lambda: (plot.set_data(history), plot.canvas.draw()), 3)
+    plot.close()
+    return {
+        "frame_blit": latency(blit),
+        "frame_full_draw": latency(full),
+        "set_data_1m_draw": latency(set_data),
+    }
+
+
+@benchmark("csv")
+def bench_csv(scale, workdir):
+    import fileio
+
+    count = max(int(200_000 * scale), 1000)
+    times, columns = synthetic_history(count)
+    results = {"rows": count}
+    for fmt, export, load in (
+        ("csv", fileio.export_csv, fileio.import_csv),
+        ("smp", fileio.export_binary, fileio.import_binary),
+    ):
+        filename = os.path.join(workdir, f"bench.{fmt}")
+        start = time.perf_counter()
+        export(filename, times, columns)
+        export_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        buffer, skipped = load(filename)
+        import_seconds = time.perf_counter() - start
+        results[f"{fmt}_export_rows_per_sec"] = rate(count, export_seconds)
+        results[f"{fmt}_import_rows_per_sec"] = rate(count, import_seconds)
+        results[f"{fmt}_file_bytes"] = os.path.getsize(filename)
+    return results
+
+
+@benchmark("memory")
+def bench_memory(scale, workdir):
+    from ringbuffer import SampleBuffer
+
+    times, columns = synthetic_history(HISTORY_SIZE)
+    tracemalloc.start()
+    buffer = SampleBuffer.from_arrays(times, columns)
+    appends = max(int(50_000 * scale), 1000)
+    for i in range(appends):
+        buffer.append(i, {"cpu": 1.0, "memory": 2.0, "gpu": 3.0, "network_kb": 4.0})
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    count = max(int(1_000_000 * scale), 1000)
+    times, columns = synthetic_history(count)
+    large = SampleBuffer.from_arrays(times, columns)
+    last_hour = int(times[-1]) - 3600
+    return {
+        "samples": HISTORY_SIZE,
+        "sample_buffer_peak_mb": peak / 2 ** 20,
+        "appends_after_fill": appends,
+        "stats_samples": count,
+        "stats_all": latency(measure(large.stats, 5)),
+        "stats_last_hour": latency(measure(lambda: large.stats(last_hour), 20)),
+    }
+
+
+@benchmark("remote")
+def bench_remote(scale, workdir):
+    from db import SQLiteHandler, UsageWriter
+    from remote import Agent, CollectorServer
+
+    previous = SQLiteHandler.DB_FILE
+    SQLiteHandler.DB_FILE = os.path.join(workdir, "central.db")
+    SQLiteHandler.init_db()
+    # синтетические отметки времени давно прошли, поэтому очистка старых строк отключена
+    writer = UsageWriter(batch_size=5000, flush_interval=0.1, retention_days=0)
+    writer.start()
+    server = CollectorServer(writer)
+    address = f"unix:{os.path.join(workdir, 'collector.sock')}"
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    def serve():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(server.start(address))
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    started.wait()
+
+    agents = [Agent(address, f"node{i}", batch_size=500, flush_interval=0.1) for i in range(8)]
+    per_agent = max(int(20_000 * scale), 100)
+    start = time.perf_counter()
+    for agent in agents:
+        agent.start()
+    for k in range(per_agent):
+        row = {"time": 1_700_000_000 + k, "cpu": float(k % 100), "memory": 50.0, "gpu": 10.0, "network_kb": 1.0}
+        for agent in agents:
+            agent.put(row)
+    for agent in agents:
+        agent.stop(timeout=60)
+    received_seconds = time.perf_counter() - start
+    writer.flush()
+    stored_seconds = time.perf_counter() - start
+
+    stored = SQLiteHandler.get_connection().execute("SELECT count(*) FROM system_usage").fetchone()[0]
+    asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    writer.stop()
+    SQLiteHandler.close_connection()
+    SQLiteHandler.DB_FILE = previous
+    total = per_agent * len(agents)
+    return {
+        "agents": len(agents),
+        "samples": total,
+        "stored": stored,
+        "received_per_sec": rate(server.received_rows, received_seconds),
+        "stored_per_sec": rate(stored, stored_seconds),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности сбора, хранения, отрисовки и CSV")
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS), help="Запустить только эти группы")
+    parser.add_argument("--scale", type=float, default=1.0, help="Множитель объёма данных (0.1 — быстрый прогон)")
+    parser.add_argument("--output", default="bench_results.json", help="Куда сохранить результаты в JSON")
+    args = parser.parse_args(argv)
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "scale": args.scale,
+        },
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in args.only or BENCHMARKS:
+            print(f"{name}...", flush=True)
+            report["results"][name] = BENCHMARKS[name](args.scale, workdir)
+            print(json.dumps(report["results"][name], indent=2, ensure_ascii=False), flush=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Результаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import threading
+import time
+
+from metrics import METRICS
+
+
+class Collector(threading.Thread):
+    """Фоновый поток, опрашивающий компоненты SystemMonitor каждый со своим интервалом.
+
+    Интервал берётся из атрибута interval компонента. Опрашиваются только
+    компоненты из consumers — те, чьи данные кто-то использует. Показание
+    отправляется в callback после каждого опроса самого частого компонента;
+    для остальных в нём лежит последнее снятое значение. Когда загрузка
+    процессора хоста не ниже BUSY_PERCENT, все интервалы удваиваются
+    (вплоть до MAX_BACKOFF раз) и возвращаются к норме, когда хост освободится.
+
+    Компоненты опрашиваются параллельно, и ожидание ограничено timeout секундами,
+    поэтому зависший источник не задерживает остальные. Имена компонентов,
+    чьи значения в показании устарели, передаются в ключе "stale", а тех,
+    что были заново опрошены с прошлого показания, — в ключе "fresh".
+    """
+
+    BUSY_PERCENT = 90
+    MAX_BACKOFF = 8
+
+    def __init__(self, monitor, callback, consumers=None, timeout=0.5):
+        super().__init__(name="collector", daemon=True)
+        self.monitor = monitor
+        self.callback = callback
+        components = monitor.components
+        self.components = {
+            name: component for name, component in components.items()
+            if consumers is None or name in consumers
+        }
+        self.base = min(self.components, key=lambda name: self.components[name].interval)
+        self.timeout = timeout
+        self.backoff = 1
+        self.latest = {}
+        self.stale = set()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        next_due = dict.fromkeys(self.components, time.monotonic())
+        fresh = set()
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            due = [name for name, when in next_due.items() if when <= now]
+            if self.base in due:
+                # насколько тик опоздал относительно расписания
+                jitter_ms = (now - next_due[self.base]) * 1e3
+                METRICS.observe("collector.tick_jitter", jitter_ms)
+                METRICS.set_gauge("collector.tick_jitter_ms", jitter_ms)
+            if due:
+                with METRICS.timed("collector.tick"):
+                    usage = self.monitor.get_all_usage(due, timeout=self.timeout)
+                stale = set(usage.pop("stale"))
+                self.stale = (self.stale - set(due)) | stale
+                fresh |= set(due) - stale
+                self.latest.update(usage)
+            for name in due:
+                # не пытаемся догонять пропущенные тики, если опрос затянулся
+                next_due[name] = max(next_due[name] + self.components[name].interval * self.backoff, now)
+
+            if self.base in due:
+                self.update_backoff()
+                self.callback(time.time(), dict(self.latest, stale=sorted(self.stale), fresh=sorted(fresh)))
+                fresh = set()
+
+            self._stop_event.wait(max(0, min(next_due.values()) - time.monotonic()))
+
+    def update_backoff(self):
+        cpu = self.latest.get("cpu")
+        if cpu is None:
+            return
+        if cpu["usage_percent"] >= self.BUSY_PERCENT:
+            self.backoff = min(self.backoff * 2, self.MAX_BACKOFF)
+        else:
+            self.backoff = max(self.backoff // 2, 1)
+
+    def stop(self, timeout=2.0):
+        """Останавливает поток и дожидается его завершения"""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+
+class RowBuilder:
+    """Сводит показания компонентов в строку system_usage: cpu, memory, gpu, network_kb"""
+
+    # компоненты, из которых строится строка
+    SOURCES = ("cpu", "memory", "gpu", "network")
+
+    def build(self, usage):
+        """:return: dict для SampleBuffer и SQLiteHandler или None, если нужных компонентов ещё нет"""
+        if "cpu" not in usage or "memory" not in usage or "network" not in usage:
+            # первый опрос ещё не вернулся — строить нечего
+            return None
+        return {
+            "cpu": usage["cpu"]["usage_percent"],
+            "memory": usage["memory"]["percent"],
+            "gpu": self.get_gpu_load(usage.get("gpu")),
+            "network_kb": usage["network"]["sent_kb_s"] + usage["network"]["recv_kb_s"],
+        }
+
+    @staticmethod
+    def get_gpu_load(gpu_usage):
+        if isinstance(gpu_usage, list) and gpu_usage:
+            return gpu_usage[0].get("load_percent", 0)
+        if isinstance(gpu_usage, dict):
+            return gpu_usage.get("load_percent", 0)
+        return 0
@@ -1,11 +1,96 @@
+import heapq
+import os
+import time
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, wait
 
-from psutil import cpu_freq, cpu_percent, cpu_count, virtual_memory, disk_partitions, disk_usage, net_if_addrs, \
-    net_io_counters
+from metrics import METRICS
+
+from psutil import cpu_freq, cpu_times, cpu_count, virtual_memory, disk_partitions, disk_usage, disk_io_counters, \
+    net_if_addrs, net_io_counters, pids, Process, NoSuchProcess, AccessDenied, ZombieProcess
 from platform import processor
 
 
+def counter_delta(previous, current):
+    """Прирост накопительного счётчика с учётом сброса в ноль.
+
+    Переполнение 32-битных счётчиков psutil исправляет сам (nowrap=True по
+    умолчанию), поэтому уменьшение значения — это сброс.
+    """
+    if current >= previous:
+        return current - previous
+    # счётчик сбросили (перезапуск интерфейса, переподключение диска) — считаем его от нуля
+    return current
+
+
+class RateCounter:
+    """Скорости накопительных счётчиков по устройствам, по разнице монотонного времени между опросами"""
+
+    def __init__(self):
+        self._last_time = None
+        self._last = {}
+
+    def update(self, counters, now=None):
+        """
+        :param counters: {устройство: кортеж счётчиков}
+        :param now: Время опроса по time.monotonic()
+        :return: {устройство: кортеж скоростей в единицах в секунду}; для устройств,
+                 появившихся в этом опросе, и при первом опросе скорости нулевые
+        """
+        now = time.monotonic() if now is None else now
+        elapsed = None if self._last_time is None else now - self._last_time
+        rates = {}
+        for device, values in counters.items():
+            previous = self._last.get(device)
+            if previous is None or not elapsed or elapsed <= 0:
+                rates[device] = (0.0,) * len(values)
+            else:
+                rates[device] = tuple(counter_delta(p, c) / elapsed for p, c in zip(previous, values))
+        # исчезнувшие устройства забываются, чтобы при возвращении не считать прирост за всё время отсутствия
+        self._last = counters
+        self._last_time = now
+        return rates
+
+
+def busy_percent(previous, current):
+    """Загрузка процессора в процентах между двумя снимками psutil.cpu_times(), как её считает cpu_percent"""
+    def split(times):
+        # guest и guest_nice уже входят в user и nice
+        total = sum(times) - getattr(times, "guest", 0) - getattr(times, "guest_nice", 0)
+        return total, total - times.idle - getattr(times, "iowait", 0)
+
+    total_before, busy_before = split(previous)
+    total, busy = split(current)
+    if total <= total_before:
+        return 0.0
+    return round(min(max((busy - busy_before) / (total - total_before) * 100, 0.0), 100.0), 1)
+
+
+class BusyCounter:
+    """Загрузка процессора (или каждого ядра) с прошлого опроса.
+
+    psutil.cpu_percent(interval=None) хранит прошлый замер отдельно для
+    каждого потока, а компоненты опрашивает тот поток пула, который свободен:
+    замер охватывал бы случайный промежуток, а первый вызов в потоке давал бы 0.
+    Здесь прошлый снимок cpu_times хранится в объекте, так что поток не важен.
+    """
+
+    def __init__(self, percpu=False):
+        self.percpu = percpu
+        self._last = cpu_times(percpu=percpu)
+
+    def update(self):
+        current = cpu_times(percpu=self.percpu)
+        previous, self._last = self._last, current
+        if self.percpu:
+            return [busy_percent(p, c) for p, c in zip(previous, current)]
+        return busy_percent(previous, current)
+
+
 class Component(ABC):
+    # как часто планировщик опрашивает компонент, в секундах
+    interval = 5.0
+
     @abstractmethod
     def get_info(self) -> dict:
         """Метод для получения общей информации и компоненте"""
@@ -20,8 +105,11 @@ class Component(ABC):
 class Processor(Component):
     """Класс для получения информации о процессоре"""
 
+    interval = 1.0
+
     def __init__(self):
         self.name = self.get_name()
+        self._busy = BusyCounter()
 
     def get_name(self) -> str:
         return processor() or "Неизвестный процессор"
@@ -36,10 +124,17 @@ class Processor(Component):
             "max_frequency": freq.max if freq else None,
         }
 
-    def get_usage(self, interval=0.5):
+    def get_usage(self, interval=None):
+        """
+        :param interval: Интервал замера в секундах; None — неблокирующий замер с момента прошлого вызова
+        :return: dict
+        """
+        if interval:
+            self._busy.update()
+            time.sleep(interval)
         freq = cpu_freq()
         return {
-            "usage_percent": cpu_percent(interval=interval),
+            "usage_percent": self._busy.update(),
             "current_frequency": freq.current if freq else None,
         }
 
@@ -47,9 +142,66 @@ class Processor(Component):
         return cpu_count(logical=False), cpu_count(logical=True)
 
 
+class Processes(Component):
+    """Класс для получения загрузки по ядрам и самых нагружающих систему процессов.
+
+    Объекты psutil.Process хранятся между тиками по pid, поэтому на каждом
+    тике обрабатываются только появившиеся и завершившиеся процессы, а у
+    остальных считается разница счётчиков.
+    """
+
+    interval = 2.0
+
+    def __init__(self, top_n=5):
+        self.top_n = top_n
+        self._processes = {}
+        self._busy = BusyCounter(percpu=True)
+
+    def get_info(self):
+        return {"logical_cores": cpu_count(logical=True), "top_n": self.top_n}
+
+    def get_usage(self):
+        per_core = self._busy.update()
+
+        current = set(pids())
+        for pid in self._processes.keys() - current:
+            del self._processes[pid]
+        for pid in current - self._processes.keys():
+            try:
+                process = Process(pid)
+                # первый замер только запоминает счётчики, проценты появятся со следующего тика
+                process.cpu_percent(interval=None)
+                process.name()
+            except (NoSuchProcess, AccessDenied, ZombieProcess):
+                continue
+            self._processes[pid] = process
+
+        rows = []
+        for pid, process in list(self._processes.items()):
+            try:
+                with process.oneshot():
+                    cpu = process.cpu_percent(interval=None)
+                    rss = process.memory_info().rss
+            except NoSuchProcess:
+                del self._processes[pid]
+                continue
+            except (AccessDenied, ZombieProcess):
+                continue
+            rows.append({"pid": pid, "name": process.name(), "cpu_percent": cpu, "rss": rss})
+
+        return {
+            "per_core": per_core,
+            "process_count": len(rows),
+            "top_cpu": heapq.nlargest(self.top_n, rows, key=lambda row: row["cpu_percent"]),
+            "top_memory": heapq.nlargest(self.top_n, rows, key=lambda row: row["rss"]),
+        }
+
+
 class Memory(Component):
     """Класс для получения информации об оперативной памяти"""
 
+    interval = 1.0
+
     def get_info(self):
         mem = virtual_memory()
         return {"total": mem.total}
@@ -66,6 +218,8 @@ class Memory(Component):
 class Disk(Component):
     """Класс для получения информации о дисках"""
 
+    interval = 60.0
+
     def get_info(self):
         partitions = disk_partitions()
         return {
@@ -86,55 +240,226 @@ class Disk(Component):
         }
 
 
+class DiskIO(Component):
+    """Скорость чтения и записи и число операций в секунду по каждому диску"""
+
+    interval = 2.0
+
+    def __init__(self):
+        self._rates = RateCounter()
+
+    def get_info(self):
+        return {"disks": sorted(disk_io_counters(perdisk=True) or {})}
+
+    def get_usage(self):
+        # в контейнерах и на части платформ счётчиков нет — тогда disk_io_counters возвращает None
+        counters = disk_io_counters(perdisk=True) or {}
+        rates = self._rates.update({
+            disk: (c.read_bytes, c.write_bytes, c.read_count, c.write_count) for disk, c in counters.items()
+        })
+        disks = {
+            disk: {
+                "read_kb_s": read / 1024,
+                "write_kb_s": write / 1024,
+                "read_iops": reads,
+                "write_iops": writes,
+            }
+            for disk, (read, write, reads, writes) in rates.items()
+        }
+        return {
+            "disks": disks,
+            "read_kb_s": sum(d["read_kb_s"] for d in disks.values()),
+            "write_kb_s": sum(d["write_kb_s"] for d in disks.values()),
+        }
+
+
 class Network(Component):
     """Класс для получения информации о сети"""
 
+    interval = 2.0
+
+    def __init__(self):
+        self._rates = RateCounter()
+
     def get_info(self):
         addrs = net_if_addrs()
         return {"interfaces": list(addrs.keys())}
 
     def get_usage(self):
-        net = net_io_counters()
+        counters = net_io_counters(pernic=True)
+        rates = self._rates.update({nic: (c.bytes_sent, c.bytes_recv) for nic, c in counters.items()})
+        interfaces = {
+            nic: {"sent_kb_s": sent / 1024, "recv_kb_s": recv / 1024}
+            for nic, (sent, recv) in rates.items()
+        }
         return {
-            "bytes_sent": net.bytes_sent,
-            "bytes_recv": net.bytes_recv,
-            "packets_sent": net.packets_sent,
-            "packets_recv": net.packets_recv
+            "bytes_sent": sum(c.bytes_sent for c in counters.values()),
+            "bytes_recv": sum(c.bytes_recv for c in counters.values()),
+            "packets_sent": sum(c.packets_sent for c in counters.values()),
+            "packets_recv": sum(c.packets_recv for c in counters.values()),
+            "sent_kb_s": sum(i["sent_kb_s"] for i in interfaces.values()),
+            "recv_kb_s": sum(i["recv_kb_s"] for i in interfaces.values()),
+            "interfaces": interfaces,
         }
 
 
-class GPU(Component):
-    """Класс для получения информации о видеокарте (через GPUtil, если доступен)"""
+class GPUBackend(ABC):
+    """Источник данных о видеокартах. Статические сведения читаются один раз, счётчики — на каждом тике"""
+
+    name = ""
+
+    @abstractmethod
+    def device_info(self) -> list[dict]:
+        """Неизменные за сессию сведения: имя, драйвер, объём памяти"""
+        ...
+
+    @abstractmethod
+    def device_usage(self) -> list[dict]:
+        """Текущие счётчики: загрузка, занятая память, температура"""
+        ...
+
+
+class NVMLBackend(GPUBackend):
+    """Опрос через NVML (pynvml) по дескрипторам устройств, открытым один раз"""
+
+    name = "nvml"
 
     def __init__(self):
-        try:
-            import GPUtil
-            self.GPUtil = GPUtil
-        except ImportError:
-            self.GPUtil = None
+        import pynvml
+        self.nvml = pynvml
+        pynvml.nvmlInit()
+        self.handles = [pynvml.nvmlDeviceGetHandleByIndex(i) for i in range(pynvml.nvmlDeviceGetCount())]
 
-    def get_info(self):
-        if not self.GPUtil:
-            return {"error": "Библиотека GPUtil не установлена"}
+    def device_info(self):
+        driver = self.nvml.nvmlSystemGetDriverVersion()
+        return [
+            {
+                "name": self.nvml.nvmlDeviceGetName(handle),
+                "driver": driver,
+                "memory_total": self.nvml.nvmlDeviceGetMemoryInfo(handle).total / 2 ** 20,
+            }
+            for handle in self.handles
+        ]
+
+    def device_usage(self):
+        usage = []
+        for handle in self.handles:
+            usage.append({
+                "load_percent": self.nvml.nvmlDeviceGetUtilizationRates(handle).gpu,
+                "memory_used": self.nvml.nvmlDeviceGetMemoryInfo(handle).used / 2 ** 20,
+                "temperature": self.nvml.nvmlDeviceGetTemperature(handle, self.nvml.NVML_TEMPERATURE_GPU),
+            })
+        return usage
+
+
+class GPUtilBackend(GPUBackend):
+    """Опрос через GPUtil: каждый вызов запускает nvidia-smi"""
+
+    name = "gputil"
+
+    def __init__(self):
+        import GPUtil
+        self.GPUtil = GPUtil
+
+    def device_info(self):
+        return [
+            {"name": gpu.name, "driver": getattr(gpu, "driver", None), "memory_total": gpu.memoryTotal}
+            for gpu in self.GPUtil.getGPUs()
+        ]
+
+    def device_usage(self):
+        return [
+            {"load_percent": gpu.load * 100, "memory_used": gpu.memoryUsed, "temperature": gpu.temperature}
+            for gpu in self.GPUtil.getGPUs()
+        ]
+
+
+class FakeGPUBackend(GPUBackend):
+    """Детерминированная видеокарта в памяти процесса — для машин без GPU и тестов"""
+
+    name = "fake"
+
+    def __init__(self, count=1, memory_total=8192):
+        self.count = count
+        self.memory_total = memory_total
+        self.tick = 0
 
-        gpus = self.GPUtil.getGPUs()
+    def device_info(self):
         return [
-            {"name": gpu.name, "driver": getattr(gpu, "driver", None)}
-            for gpu in gpus
+            {"name": f"Fake GPU {i}", "driver": "0.0", "memory_total": self.memory_total}
+            for i in range(self.count)
         ]
 
+    def device_usage(self):
+        self.tick += 1
+        # пилообразная загрузка с периодом 100 тиков, у каждой карты своя фаза
+        usage = []
+        for i in range(self.count):
+            load = (self.tick + 10 * i) % 100
+            usage.append({
+                "load_percent": float(load),
+                "memory_used": self.memory_total * load / 100,
+                "temperature": 40 + load // 2,
+            })
+        return usage
+
+
+GPU_BACKENDS = {
+    NVMLBackend.name: NVMLBackend,
+    GPUtilBackend.name: GPUtilBackend,
+    FakeGPUBackend.name: FakeGPUBackend,
+}
+
+
+def load_gpu_backend(name=None):
+    """
+    Создаёт источник данных о GPU.
+
+    :param name: Имя из GPU_BACKENDS; по умолчанию берётся из переменной окружения
+                 SYSMON_GPU_BACKEND, а если её нет — первый доступный из nvml и gputil
+    :return: GPUBackend или None, если ни один источник недоступен
+    """
+    name = name or os.environ.get("SYSMON_GPU_BACKEND")
+    candidates = [name] if name else [NVMLBackend.name, GPUtilBackend.name]
+    for candidate in candidates:
+        try:
+            return GPU_BACKENDS[candidate]()
+        except Exception:
+            # нет библиотеки, драйвера или устройства — пробуем следующий источник
+            continue
+    return None
+
+
+class GPU(Component):
+    """Класс для получения информации о видеокарте через подключаемый GPUBackend"""
+
+    interval = 2.0
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else load_gpu_backend()
+        self._info = None
+
+    def get_info(self):
+        if not self.backend:
+            return {"error": "Нет доступного источника данных о GPU (pynvml или GPUtil)"}
+
+        if self._info is None:
+            self._info = self.backend.device_info()
+        return [{"name": gpu["name"], "driver": gpu["driver"]} for gpu in self._info]
+
     def get_usage(self):
-        if not self.GPUtil:
-            return {"error": "Библиотека GPUtil не установлена"}
+        if not self.backend:
+            return {"error": "Нет доступного источника данных о GPU (pynvml или GPUtil)"}
 
-        gpus = self.GPUtil.getGPUs()
+        if self._info is None:
+            self._info = self.backend.device_info()
         gpu_data = []
-        for gpu in gpus:
+        for info, usage in zip(self._info, self.backend.device_usage()):
             gpu_data.append({
-                "load_percent": gpu.load * 100,
-                "memory_total": gpu.memoryTotal,
-                "memory_used": gpu.memoryUsed,
-                "temperature": gpu.temperature
+                "load_percent": usage["load_percent"],
+                "memory_total": info["memory_total"],
+                "memory_used": usage["memory_used"],
+                "temperature": usage["temperature"]
             })
         return gpu_data
 
@@ -144,30 +469,98 @@ class SystemMonitor:
 
     def __init__(self):
         self.cpu = Processor()
+        self.processes = Processes()
         self.memory = Memory()
         self.disk = Disk()
+        self.disk_io = DiskIO()
         self.network = Network()
         self.gpu = GPU()
+        self._executor = None
+        self._pending = {}
+        self._last_usage = {}
+
+    @property
+    def components(self) -> dict[str, Component]:
+        """Компоненты, доступные для опроса; GPU попадает сюда, только если есть источник данных"""
+        components = {
+            "cpu": self.cpu,
+            "processes": self.processes,
+            "memory": self.memory,
+            "disk": self.disk,
+            "disk_io": self.disk_io,
+            "network": self.network,
+        }
+        if self.gpu.backend:
+            components["gpu"] = self.gpu
+        return components
 
     def get_all_info(self) -> dict[str, dict]:
         """Общая информация о компонентах"""
         return {
             "cpu": self.cpu.get_info(),
+            "processes": self.processes.get_info(),
             "memory": self.memory.get_info(),
             "disk": self.disk.get_info(),
+            "disk_io": self.disk_io.get_info(),
             "network": self.network.get_info(),
             "gpu": self.gpu.get_info(),
         }
 
-    def get_all_usage(self) -> dict[str, dict]:
-        """Текущее использование ресурсов"""
-        return {
-            "cpu": self.cpu.get_usage(),
-            "memory": self.memory.get_usage(),
-            "disk": self.disk.get_usage(),
-            "network": self.network.get_usage(),
-            "gpu": self.gpu.get_usage(),
-        }
+    def get_all_usage(self, names=None, timeout=None) -> dict[str, dict]:
+        """
+        Текущее использование ресурсов
+
+        :param names: Какие компоненты опросить; по умолчанию все из components
+        :param timeout: Если задан, компоненты опрашиваются параллельно и ожидание
+                        ограничено timeout секундами; см. collect_concurrently
+        """
+        components = self.components
+        names = [name for name in (names or components) if name in components]
+        if timeout is not None:
+            return self.collect_concurrently(names, timeout)
+        return {name: self._get_usage(name, components[name]) for name in names}
+
+    @staticmethod
+    def _get_usage(name, component):
+        with METRICS.timed(f"collector.{name}"):
+            return component.get_usage()
+
+    def collect_concurrently(self, names, timeout):
+        """
+        Опрашивает компоненты в пуле потоков, не дожидаясь зависших дольше timeout секунд.
+
+        Если компонент не успел ответить или упал с ошибкой, вместо свежих данных
+        возвращается его последнее успешное показание (если оно было), а имя
+        попадает в список "stale". Пока прошлый опрос компонента не завершился,
+        новый не ставится, так что зависший компонент занимает не больше одного потока.
+        """
+        components = self.components
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=len(components), thread_name_prefix="collect")
+
+        for name in names:
+            if name not in self._pending:
+                self._pending[name] = self._executor.submit(self._get_usage, name, components[name])
+        futures = {name: self._pending[name] for name in names}
+        wait(futures.values(), timeout=timeout)
+
+        usage, stale = {}, []
+        for name, future in futures.items():
+            if future.done():
+                del self._pending[name]
+                if future.exception() is None:
+                    usage[name] = self._last_usage[name] = future.result()
+                    continue
+            stale.append(name)
+            if name in self._last_usage:
+                usage[name] = self._last_usage[name]
+        usage["stale"] = stale
+        return usage
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
 
 # if __name__ == "__main__":
 #     monitor = SystemMonitor()
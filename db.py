@@ -1,24 +1,101 @@
+import math
+import queue
 import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from metrics import METRICS
+
+USAGE_COLUMNS = ("cpu", "memory", "gpu", "network_kb")
+# имя хоста для показаний, снятых на этой машине
+LOCAL_HOST = "local"
+LEGACY_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# разрешения агрегатов: суффикс таблицы usage_<имя> -> длина корзины в секундах (корзины выровнены по UTC)
+ROLLUPS = {"1m": 60, "1h": 3600, "1d": 86400}
+ROLLUP_FIELDS = ("min", "max", "avg")
+DEFAULT_RAW_RETENTION_DAYS = 30
+# порог по умолчанию для отчёта о превышениях, в процентах
+DEFAULT_REPORT_THRESHOLD = 90.0
+# метрики в процентах, для которых в отчёте считается время выше порога
+THRESHOLD_COLUMNS = ("cpu", "memory", "gpu")
+# сырые показания старше срока хранения не удаляются насовсем, а сжимаются в блоки такой длины
+ARCHIVE_BLOCK_SECONDS = 3600
 
 
 class SQLiteHandler:
     DB_FILE = "system_data.db"
+    _local = threading.local()
+
+    @staticmethod
+    def get_connection():
+        """Долгоживущее соединение текущего потока (sqlite3 не разрешает делить соединение между потоками)"""
+        conn = getattr(SQLiteHandler._local, "conn", None)
+        if conn is None or SQLiteHandler._local.path != SQLiteHandler.DB_FILE:
+            if conn is not None:
+                conn.close()
+            conn = sqlite3.connect(SQLiteHandler.DB_FILE)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            SQLiteHandler._local.conn = conn
+            SQLiteHandler._local.path = SQLiteHandler.DB_FILE
+        return conn
+
+    @staticmethod
+    def close_connection():
+        conn = getattr(SQLiteHandler._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            SQLiteHandler._local.conn = None
 
     @staticmethod
     def init_db():
-        conn = sqlite3.connect(SQLiteHandler.DB_FILE)
+        conn = SQLiteHandler.get_connection()
         c = conn.cursor()
 
         c.execute("""
             CREATE TABLE IF NOT EXISTS system_usage (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                time TEXT,
+                time INTEGER NOT NULL,
                 cpu REAL,
                 memory REAL,
                 gpu REAL,
-                network_kb REAL
+                network_kb REAL,
+                host TEXT NOT NULL DEFAULT 'local'
             )
         """)
+        SQLiteHandler.migrate_time_column(conn)
+        SQLiteHandler.migrate_host_column(conn)
+        c.execute("DROP INDEX IF EXISTS idx_system_usage_time")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_system_usage_host_time ON system_usage (host, time)")
+
+        metric_columns = ", ".join(f"{m}_{f} REAL" for m in USAGE_COLUMNS for f in ROLLUP_FIELDS)
+        for name in ROLLUPS:
+            columns = {r[1] for r in c.execute(f"PRAGMA table_info(usage_{name})")}
+            if columns and "host" not in columns:
+                # агрегаты без хоста пересобираются из сырых данных ниже
+                c.execute(f"DROP TABLE usage_{name}")
+            c.execute(f"""
+                CREATE TABLE IF NOT EXISTS usage_{name} (
+                    host TEXT NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    {metric_columns},
+                    PRIMARY KEY (host, bucket)
+                ) WITHOUT ROWID
+            """)
+
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS usage_archive (
+                host TEXT NOT NULL,
+                block INTEGER NOT NULL,
+                last_time INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (host, block)
+            ) WITHOUT ROWID
+        """)
 
         c.execute("""
             CREATE TABLE IF NOT EXISTS user_settings (
@@ -38,66 +115,704 @@ class SQLiteHandler:
             )
         """)
 
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS alerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                time INTEGER NOT NULL,
+                host TEXT NOT NULL,
+                metric TEXT,
+                kind TEXT,
+                value REAL,
+                message TEXT
+            )
+        """)
+        # покрывающий индекс для отчёта по оповещениям: группировка по дню и метрике без чтения таблицы
+        c.execute("CREATE INDEX IF NOT EXISTS idx_alerts_host_time ON alerts (host, time, metric, kind)")
+
+        # номер последнего показания каждого журнала, уже лежащего в system_usage; пишется той же транзакцией,
+        # что и сами показания, поэтому восстановление после сбоя не вставит их второй раз
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS journal_state (
+                journal TEXT PRIMARY KEY,
+                session INTEGER NOT NULL,
+                seq INTEGER NOT NULL
+            )
+        """)
+
         conn.commit()
-        conn.close()
+
+        if c.execute("SELECT 1 FROM usage_1m LIMIT 1").fetchone() is None:
+            SQLiteHandler.rebuild_rollups()
+
+    @staticmethod
+    def migrate_time_column(conn):
+        """Переводит system_usage.time из строки «ГГГГ-ММ-ДД ЧЧ:ММ:СС» в целое число секунд эпохи"""
+        columns = {r[1]: r[2] for r in conn.execute("PRAGMA table_info(system_usage)")}
+        if columns.get("time", "").upper() == "INTEGER":
+            return
+
+        def to_epoch(value):
+            try:
+                return int(datetime.strptime(value, LEGACY_TIME_FORMAT).timestamp())
+            except (TypeError, ValueError):
+                return 0
+
+        conn.create_function("to_epoch", 1, to_epoch, deterministic=True)
+        with conn:
+            conn.execute("BEGIN")
+            conn.execute("ALTER TABLE system_usage RENAME TO system_usage_legacy")
+            conn.execute("""
+                CREATE TABLE system_usage (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    time INTEGER NOT NULL,
+                    cpu REAL,
+                    memory REAL,
+                    gpu REAL,
+                    network_kb REAL
+                )
+            """)
+            conn.execute("""
+                INSERT INTO system_usage (id, time, cpu, memory, gpu, network_kb)
+                SELECT id, to_epoch(time), cpu, memory, gpu, network_kb FROM system_usage_legacy ORDER BY id
+            """)
+            conn.execute("DROP TABLE system_usage_legacy")
+
+    @staticmethod
+    def migrate_host_column(conn):
+        """Добавляет system_usage.host; все ранее собранные показания считаются локальными"""
+        columns = {r[1] for r in conn.execute("PRAGMA table_info(system_usage)")}
+        if "host" not in columns:
+            conn.execute(f"ALTER TABLE system_usage ADD COLUMN host TEXT NOT NULL DEFAULT '{LOCAL_HOST}'")
 
     @staticmethod
     def insert_usage(data):
-        conn = sqlite3.connect(SQLiteHandler.DB_FILE)
-        c = conn.cursor()
-        c.execute("""
-            INSERT INTO system_usage (time, cpu, memory, gpu, network_kb)
+        SQLiteHandler.insert_usage_many([data])
+
+    @staticmethod
+    def insert_usage_many(rows, journal=None):
+        """
+        Вставляет пачку показаний и обновляет агрегаты одной транзакцией; хост берётся из ключа "host" строки
+
+        :param journal: (имя журнала, сеанс, номер) — в той же транзакции отмечается, что показания журнала
+                        до этого номера включительно уже в БД
+        """
+        params = [
+            (r.get("host", LOCAL_HOST), int(r["time"]), r["cpu"], r["memory"], r["gpu"], r["network_kb"])
+            for r in rows
+        ]
+        if not params and journal is None:
+            return
+        conn = SQLiteHandler.get_connection()
+        with conn:
+            conn.executemany("""
+                INSERT INTO system_usage (host, time, cpu, memory, gpu, network_kb)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, params)
+            SQLiteHandler._update_rollups(conn, params)
+            if journal is not None:
+                conn.execute("""
+                    INSERT INTO journal_state (journal, session, seq) VALUES (?, ?, ?)
+                    ON CONFLICT(journal) DO UPDATE SET session = excluded.session, seq = excluded.seq
+                """, journal)
+
+    @staticmethod
+    def _rollup_upsert_sql(name):
+        columns = [f"{m}_{f}" for m in USAGE_COLUMNS for f in ROLLUP_FIELDS]
+        updates = []
+        for m in USAGE_COLUMNS:
+            # пустое (NULL) значение с любой стороны не затирает известное
+            updates.append(f"{m}_min = min(coalesce({m}_min, excluded.{m}_min), coalesce(excluded.{m}_min, {m}_min))")
+            updates.append(f"{m}_max = max(coalesce({m}_max, excluded.{m}_max), coalesce(excluded.{m}_max, {m}_max))")
+            updates.append(
+                f"{m}_avg = coalesce(({m}_avg * count + excluded.{m}_avg * excluded.count) / (count + excluded.count), "
+                f"{m}_avg, excluded.{m}_avg)"
+            )
+        updates.append("count = count + excluded.count")
+        return f"""
+            INSERT INTO usage_{name} (host, bucket, count, {", ".join(columns)})
+            VALUES ({", ".join("?" * (len(columns) + 3))})
+            ON CONFLICT(host, bucket) DO UPDATE SET {", ".join(updates)}
+        """
+
+    @staticmethod
+    def _update_rollups(conn, params):
+        """
+        Сворачивает пачку строк (host, time, *USAGE_COLUMNS) по корзинам и добавляет её в агрегаты.
+        Пустые значения (None) пропускаются, как их пропускают min/max/avg в SQL
+        """
+        for name, seconds in ROLLUPS.items():
+            buckets = {}
+            for host, time_value, *values in params:
+                bucket = (host, time_value - time_value % seconds)
+                acc = buckets.get(bucket)
+                if acc is None:
+                    acc = buckets[bucket] = [0, [None] * len(values), [None] * len(values), [0.0] * len(values),
+                                             [0] * len(values)]
+                acc[0] += 1
+                for k, v in enumerate(values):
+                    if v is None:
+                        continue
+                    acc[1][k] = v if acc[1][k] is None else min(acc[1][k], v)
+                    acc[2][k] = v if acc[2][k] is None else max(acc[2][k], v)
+                    acc[3][k] += v
+                    acc[4][k] += 1
+
+            upserts = []
+            for (host, bucket), (count, mins, maxs, sums, filled) in buckets.items():
+                row = [host, bucket, count]
+                for k in range(len(USAGE_COLUMNS)):
+                    row += [mins[k], maxs[k], sums[k] / filled[k] if filled[k] else None]
+                upserts.append(row)
+            conn.executemany(SQLiteHandler._rollup_upsert_sql(name), upserts)
+
+    @staticmethod
+    def rebuild_rollups():
+        """Пересчитывает все агрегаты по сырым показаниям (для баз, заполненных до появления агрегатов)"""
+        conn = SQLiteHandler.get_connection()
+        with conn:
+            for name, seconds in ROLLUPS.items():
+                aggregates = ", ".join(
+                    f"min({m}), max({m}), avg({m})" for m in USAGE_COLUMNS
+                )
+                columns = ", ".join(f"{m}_{f}" for m in USAGE_COLUMNS for f in ROLLUP_FIELDS)
+                conn.execute(f"DELETE FROM usage_{name}")
+                conn.execute(f"""
+                    INSERT INTO usage_{name} (host, bucket, count, {columns})
+                    SELECT host, time - time % {seconds} AS bucket, count(*), {aggregates}
+                    FROM system_usage GROUP BY host, bucket
+                """)
+
+    @staticmethod
+    def prune_usage(retention_days):
+        """
+        Переносит сырые показания старше retention_days дней в usage_archive и удаляет их из system_usage.
+
+        Граница округляется вниз до начала блока архива, чтобы в архив попадали только закрытые блоки.
+        """
+        cutoff = int(time.time()) - int(retention_days * 86400)
+        cutoff -= cutoff % ARCHIVE_BLOCK_SECONDS
+        conn = SQLiteHandler.get_connection()
+        deleted = 0
+        with conn:
+            # по хостам, чтобы удаление шло по индексу (host, time)
+            for host in SQLiteHandler.fetch_hosts():
+                SQLiteHandler._archive_host(conn, host, cutoff)
+                deleted += conn.execute(
+                    "DELETE FROM system_usage WHERE host = ? AND time < ?", (host, cutoff)
+                ).rowcount
+        return deleted
+
+    @staticmethod
+    def _archive_host(conn, host, before):
+        """Сжимает сырые показания хоста с time < before в блоки по ARCHIVE_BLOCK_SECONDS"""
+        next_time = conn.execute(
+            "SELECT min(time) FROM system_usage WHERE host = ? AND time < ?", (host, before)
+        ).fetchone()[0]
+        while next_time is not None:
+            block = next_time - next_time % ARCHIVE_BLOCK_SECONDS
+            block_end = min(block + ARCHIVE_BLOCK_SECONDS, before)
+            rows = conn.execute(
+                f"SELECT time, {', '.join(USAGE_COLUMNS)} FROM system_usage "
+                f"WHERE host = ? AND time >= ? AND time < ? ORDER BY time",
+                (host, block, block_end)
+            ).fetchall()
+            SQLiteHandler._store_archive_block(conn, host, block, rows)
+            # пропуски в данных перескакиваются сразу, без пустых запросов по каждому часу
+            next_time = conn.execute(
+                "SELECT min(time) FROM system_usage WHERE host = ? AND time >= ? AND time < ?",
+                (host, block_end, before)
+            ).fetchone()[0]
+
+    @staticmethod
+    def _store_archive_block(conn, host, block, rows):
+        import numpy as np
+        from archive import decode_block, encode_block
+
+        table = np.array(rows, dtype=np.float64)
+        times = table[:, 0].astype(np.int64)
+        columns = {name: table[:, i] for i, name in enumerate(USAGE_COLUMNS, start=1)}
+        existing = conn.execute(
+            "SELECT data FROM usage_archive WHERE host = ? AND block = ?", (host, block)
+        ).fetchone()
+        if existing is not None:
+            # в закрытый блок догрузили опоздавшие показания (например, агент после обрыва связи)
+            old_times, old_columns = decode_block(existing[0], USAGE_COLUMNS)
+            order = np.argsort(np.concatenate([old_times, times]), kind="stable")
+            times = np.concatenate([old_times, times])[order]
+            columns = {name: np.concatenate([old_columns[name], columns[name]])[order] for name in USAGE_COLUMNS}
+        conn.execute("""
+            INSERT OR REPLACE INTO usage_archive (host, block, last_time, count, data)
             VALUES (?, ?, ?, ?, ?)
-        """, (data["time"], data["cpu"], data["memory"], data["gpu"], data["network_kb"]))
-        conn.commit()
-        conn.close()
+        """, (host, block, int(times[-1]), len(times), encode_block(times, columns)))
+
+    @staticmethod
+    def fetch_archive_blocks(start, end, host=LOCAL_HOST):
+        """
+        По одному распаковывает блоки архива, пересекающие [start, end)
+
+        :return: Генератор пар (times, {метрика: значения}), обрезанных по диапазону
+        """
+        import numpy as np
+        from archive import decode_block
+
+        c = SQLiteHandler.get_connection().cursor()
+        c.execute(
+            "SELECT data FROM usage_archive WHERE host = ? AND block > ? AND block < ? AND last_time >= ? "
+            "ORDER BY block",
+            (host, int(start) - ARCHIVE_BLOCK_SECONDS, int(end), int(start))
+        )
+        for (data,) in c:
+            times, columns = decode_block(data, USAGE_COLUMNS)
+            lo, hi = np.searchsorted(times, start), np.searchsorted(times, end)
+            if hi > lo:
+                yield times[lo:hi], {name: values[lo:hi] for name, values in columns.items()}
+
+    @staticmethod
+    def fetch_archive_range(start, end, columns=USAGE_COLUMNS, host=LOCAL_HOST):
+        """То же, что fetch_usage_range, но по архиву: генератор кортежей (time, *columns)"""
+        import numpy as np
+
+        unknown = set(columns) - set(USAGE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Неизвестные столбцы: {', '.join(sorted(unknown))}")
+        for times, values in SQLiteHandler.fetch_archive_blocks(start, end, host):
+            # пустые значения возвращаются как NULL из system_usage — None, а не NaN
+            yield from zip(times.tolist(), *(
+                [None if v != v else v for v in values[name].tolist()] if np.isnan(values[name]).any()
+                else values[name].tolist()
+                for name in columns
+            ))
+
+    @staticmethod
+    def fetch_sample_count(start, end, host=LOCAL_HOST, resolution=None):
+        """
+        Сколько показаний хоста попало в [start, end): по system_usage и задевающим диапазон блокам архива
+        или, если задан resolution, по счётчикам корзин usage_<resolution>.
+
+        Запрос идёт по индексу и нужен как дешёвый признак того, что в диапазон дописали показания
+        (в том числе другой процесс), а не как точное число: блок архива учитывается целиком.
+        """
+        c = SQLiteHandler.get_connection().cursor()
+        if resolution is not None:
+            if resolution not in ROLLUPS:
+                raise ValueError(f"Неизвестное разрешение: {resolution}")
+            c.execute(
+                f"SELECT total(count) FROM usage_{resolution} WHERE host = ? AND bucket >= ? AND bucket < ?",
+                (host, int(start), int(end))
+            )
+            return int(c.fetchone()[0])
+        c.execute("""
+            SELECT (SELECT count(*) FROM system_usage WHERE host = ? AND time >= ? AND time < ?)
+                 + (SELECT total(count) FROM usage_archive
+                    WHERE host = ? AND block > ? AND block < ? AND last_time >= ?)
+        """, (host, int(start), int(end), host, int(start) - ARCHIVE_BLOCK_SECONDS, int(end), int(start)))
+        return int(c.fetchone()[0])
+
+    @staticmethod
+    def fetch_hosts():
+        """Хосты, от которых есть показания (по суточным агрегатам, без просмотра сырых строк)"""
+        c = SQLiteHandler.get_connection().cursor()
+        c.execute("SELECT DISTINCT host FROM usage_1d ORDER BY host")
+        return [r[0] for r in c.fetchall()]
+
+    @staticmethod
+    def fetch_journal_seq(journal, session):
+        """Номер последнего показания сеанса session журнала, уже лежащего в БД; 0, если такого нет"""
+        c = SQLiteHandler.get_connection().cursor()
+        c.execute("SELECT seq FROM journal_state WHERE journal = ? AND session = ?", (journal, session))
+        row = c.fetchone()
+        return row[0] if row else 0
 
     @staticmethod
     def fetch_all_usage():
-        conn = sqlite3.connect(SQLiteHandler.DB_FILE)
-        c = conn.cursor()
+        c = SQLiteHandler.get_connection().cursor()
         c.execute("SELECT time, cpu, memory, gpu, network_kb FROM system_usage ORDER BY id")
         rows = c.fetchall()
-        conn.close()
         return [{"time": r[0], "cpu": r[1], "memory": r[2], "gpu": r[3], "network_kb": r[4]} for r in rows]
 
+    @staticmethod
+    def fetch_usage_range(start, end, columns=USAGE_COLUMNS, chunk_size=1000, host=LOCAL_HOST):
+        """
+        Построчно отдаёт показания с start <= time < end, читая курсор порциями.
+
+        :param start: Начало диапазона, секунды эпохи
+        :param end: Конец диапазона (не включается), секунды эпохи
+        :param columns: Какие метрики вернуть вместе со временем
+        :param host: Чьи показания читать
+        :return: Генератор кортежей (time, *columns)
+        """
+        unknown = set(columns) - set(USAGE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Неизвестные столбцы: {', '.join(sorted(unknown))}")
+
+        c = SQLiteHandler.get_connection().cursor()
+        c.arraysize = chunk_size
+        c.execute(
+            f"SELECT time, {', '.join(columns)} FROM system_usage "
+            f"WHERE host = ? AND time >= ? AND time < ? ORDER BY time",
+            (host, int(start), int(end))
+        )
+        while True:
+            rows = c.fetchmany()
+            if not rows:
+                break
+            yield from rows
+
+    @staticmethod
+    def fetch_rollup_range(resolution, start, end, columns=USAGE_COLUMNS, host=LOCAL_HOST):
+        """
+        Отдаёт агрегированные показания с start <= bucket < end.
+
+        :param resolution: Ключ из ROLLUPS: "1m", "1h" или "1d"
+        :return: Генератор кортежей (bucket, count, col_min, col_max, col_avg, ...)
+        """
+        if resolution not in ROLLUPS:
+            raise ValueError(f"Неизвестное разрешение: {resolution}")
+        unknown = set(columns) - set(USAGE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Неизвестные столбцы: {', '.join(sorted(unknown))}")
+
+        fields = ", ".join(f"{m}_{f}" for m in columns for f in ROLLUP_FIELDS)
+        c = SQLiteHandler.get_connection().cursor()
+        c.arraysize = 1000
+        c.execute(
+            f"SELECT bucket, count, {fields} FROM usage_{resolution} "
+            f"WHERE host = ? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+            (host, int(start), int(end))
+        )
+        while True:
+            rows = c.fetchmany()
+            if not rows:
+                break
+            yield from rows
+
     @staticmethod
     def insert_setting(name, value):
-        conn = sqlite3.connect(SQLiteHandler.DB_FILE)
-        c = conn.cursor()
-        c.execute("""
-            INSERT INTO user_settings (setting_name, setting_value)
-            VALUES (?, ?)
-            ON CONFLICT(setting_name) DO UPDATE SET setting_value = excluded.setting_value
-        """, (name, value))
-        conn.commit()
-        conn.close()
+        conn = SQLiteHandler.get_connection()
+        with conn:
+            conn.execute("""
+                INSERT INTO user_settings (setting_name, setting_value)
+                VALUES (?, ?)
+                ON CONFLICT(setting_name) DO UPDATE SET setting_value = excluded.setting_value
+            """, (name, value))
 
     @staticmethod
     def fetch_settings():
-        conn = sqlite3.connect(SQLiteHandler.DB_FILE)
-        c = conn.cursor()
+        c = SQLiteHandler.get_connection().cursor()
         c.execute("SELECT setting_name, setting_value FROM user_settings")
         rows = c.fetchall()
-        conn.close()
         return [{"name": r[0], "value": r[1]} for r in rows]
 
+    @staticmethod
+    def fetch_setting(name, default=None):
+        c = SQLiteHandler.get_connection().cursor()
+        c.execute("SELECT setting_value FROM user_settings WHERE setting_name = ?", (name,))
+        row = c.fetchone()
+        return row[0] if row else default
+
+    @staticmethod
+    def fetch_retention_days():
+        """Настройка raw_retention_days; нечисловое или отрицательное значение заменяется значением по умолчанию"""
+        try:
+            days = float(SQLiteHandler.fetch_setting("raw_retention_days", DEFAULT_RAW_RETENTION_DAYS))
+        except (TypeError, ValueError):
+            return DEFAULT_RAW_RETENTION_DAYS
+        return days if math.isfinite(days) and days >= 0 else DEFAULT_RAW_RETENTION_DAYS
+
     @staticmethod
     def insert_hardware(cpu_name, gpu_name, ram_size_gb, os_name):
-        conn = sqlite3.connect(SQLiteHandler.DB_FILE)
-        c = conn.cursor()
-        c.execute("""
-            INSERT INTO hardware_info (cpu_name, gpu_name, ram_size_gb, os_name)
-            VALUES (?, ?, ?, ?)
-        """, (cpu_name, gpu_name, ram_size_gb, os_name))
-        conn.commit()
-        conn.close()
+        conn = SQLiteHandler.get_connection()
+        with conn:
+            conn.execute("""
+                INSERT INTO hardware_info (cpu_name, gpu_name, ram_size_gb, os_name)
+                VALUES (?, ?, ?, ?)
+            """, (cpu_name, gpu_name, ram_size_gb, os_name))
 
     @staticmethod
     def fetch_hardware():
-        conn = sqlite3.connect(SQLiteHandler.DB_FILE)
-        c = conn.cursor()
+        c = SQLiteHandler.get_connection().cursor()
         c.execute("SELECT cpu_name, gpu_name, ram_size_gb, os_name FROM hardware_info")
         rows = c.fetchall()
-        conn.close()
         return [{"cpu": r[0], "gpu": r[1], "ram": r[2], "os": r[3]} for r in rows]
+
+    @staticmethod
+    def insert_alerts(alerts):
+        if not alerts:
+            return
+        conn = SQLiteHandler.get_connection()
+        with conn:
+            conn.executemany("""
+                INSERT INTO alerts (time, host, metric, kind, value, message)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [(a["time"], a["host"], a["metric"], a["kind"], a["value"], a["message"]) for a in alerts])
+
+    @staticmethod
+    def fetch_alerts(limit=100):
+        c = SQLiteHandler.get_connection().cursor()
+        c.execute("SELECT time, host, metric, kind, value, message FROM alerts ORDER BY id DESC LIMIT ?", (limit,))
+        rows = c.fetchall()
+        return [
+            {"time": r[0], "host": r[1], "metric": r[2], "kind": r[3], "value": r[4], "message": r[5]}
+            for r in rows
+        ]
+
+    # Отчёты считаются внутри SQLite по агрегатам usage_1m / usage_1h. Эти таблицы WITHOUT ROWID
+    # с ключом (host, bucket), то есть сами являются покрывающим индексом по диапазону времени
+    # хоста: запрос за несколько месяцев читает последовательный кусок B-дерева и не трогает сырые строки.
+    # offset — смещение местного времени от UTC в секундах, чтобы сутки и часы считались по местным часам.
+
+    @staticmethod
+    def _fetch_dicts(c):
+        names = [d[0] for d in c.description]
+        return [dict(zip(names, row)) for row in c.fetchall()]
+
+    @staticmethod
+    def _weighted_columns():
+        """Средние корзин, взвешенные числом показаний; корзины с пустым средним не входят и в знаменатель"""
+        return ", ".join(
+            f"sum({m}_avg * count) / sum(CASE WHEN {m}_avg IS NOT NULL THEN count END) AS {m}_avg, "
+            f"max({m}_max) AS {m}_max"
+            for m in USAGE_COLUMNS
+        )
+
+    @staticmethod
+    def report_daily(start, end, host=LOCAL_HOST, offset=0, window_days=7):
+        """
+        Средние и пики по суткам плюс скользящее среднее за window_days календарных суток (оконная функция;
+        сутки без данных в окно не попадают, но и не растягивают его)
+
+        :return: Список словарей: day (начало суток), samples, <метрика>_avg, <метрика>_max, <метрика>_avg_<N>d
+        """
+        weighted = SQLiteHandler._weighted_columns()
+        moving = ", ".join(f"avg({m}_avg) OVER w AS {m}_avg_{window_days}d" for m in USAGE_COLUMNS)
+        plain = ", ".join(f"{m}_avg, {m}_max" for m in USAGE_COLUMNS)
+        c = SQLiteHandler.get_connection().cursor()
+        c.execute(f"""
+            WITH daily AS (
+                SELECT (bucket + :offset) / 86400 AS day, sum(count) AS samples, {weighted}
+                FROM usage_1h
+                WHERE host = :host AND bucket >= :start AND bucket < :end
+                GROUP BY day
+            )
+            SELECT day * 86400 - :offset AS day, samples, {plain}, {moving}
+            FROM daily
+            WINDOW w AS (ORDER BY day RANGE BETWEEN {int(window_days) - 1} PRECEDING AND CURRENT ROW)
+            ORDER BY day
+        """, {"host": host, "start": int(start), "end": int(end), "offset": int(offset)})
+        return SQLiteHandler._fetch_dicts(c)
+
+    @staticmethod
+    def report_peak_hours(start, end, host=LOCAL_HOST, offset=0):
+        """:return: 24 строки (или меньше, если данных нет): hour, <метрика>_avg, <метрика>_max по часу суток"""
+        weighted = SQLiteHandler._weighted_columns()
+        c = SQLiteHandler.get_connection().cursor()
+        c.execute(f"""
+            SELECT ((bucket + :offset) % 86400) / 3600 AS hour, {weighted}
+            FROM usage_1h
+            WHERE host = :host AND bucket >= :start AND bucket < :end
+            GROUP BY hour
+            ORDER BY hour
+        """, {"host": host, "start": int(start), "end": int(end), "offset": int(offset)})
+        return SQLiteHandler._fetch_dicts(c)
+
+    @staticmethod
+    def report_threshold(column, threshold, start, end, host=LOCAL_HOST):
+        """
+        Сколько минут среднее за минуту держалось не ниже threshold, число эпизодов (островов подряд идущих
+        минут выше порога) и самый длинный из них. Пропуск в данных разрывает эпизод; эпизод, уже шедший
+        к началу диапазона, тоже считается.
+        Оконная функция считается только по минутам выше порога, а не по всему диапазону.
+
+        :return: {"metric", "threshold", "minutes_above", "minutes_peak_above", "episodes", "longest_minutes"}
+        """
+        if column not in USAGE_COLUMNS:
+            raise ValueError(f"Неизвестный столбец: {column}")
+        c = SQLiteHandler.get_connection().cursor()
+        c.execute(f"""
+            WITH above AS (
+                -- острова подряд идущих минут выше порога: у минут одного острова bucket - 60 * номер совпадает,
+                -- минута ниже порога или пропуск в данных этот ключ сдвигает
+                SELECT bucket - 60 * row_number() OVER (ORDER BY bucket) AS island
+                FROM usage_1m
+                WHERE host = :host AND bucket >= :start AND bucket < :end AND {column}_avg >= :threshold
+            ),
+            episodes AS (
+                SELECT count(*) AS minutes FROM above GROUP BY island
+            )
+            SELECT coalesce(sum(minutes), 0) AS minutes_above,
+                   (SELECT count(*) FROM usage_1m
+                    WHERE host = :host AND bucket >= :start AND bucket < :end AND {column}_max >= :threshold
+                   ) AS minutes_peak_above,
+                   count(*) AS episodes,
+                   coalesce(max(minutes), 0) AS longest_minutes
+            FROM episodes
+        """, {"host": host, "start": int(start), "end": int(end), "threshold": threshold})
+        result = SQLiteHandler._fetch_dicts(c)[0]
+        return dict(metric=column, threshold=threshold, **result)
+
+    @staticmethod
+    def report_alerts(start, end, host=LOCAL_HOST, offset=0):
+        """:return: Число оповещений по суткам, метрике и виду: day, metric, kind, count"""
+        c = SQLiteHandler.get_connection().cursor()
+        c.execute("""
+            SELECT (time + :offset) / 86400 * 86400 - :offset AS day, metric, kind, count(*) AS count
+            FROM alerts
+            WHERE host = :host AND time >= :start AND time < :end
+            GROUP BY day, metric, kind
+            ORDER BY day, metric, kind
+        """, {"host": host, "start": int(start), "end": int(end), "offset": int(offset)})
+        return SQLiteHandler._fetch_dicts(c)
+
+    @staticmethod
+    def build_report(start, end, host=LOCAL_HOST, thresholds=None, offset=None):
+        """
+        Все разделы отчёта за [start, end)
+
+        :param thresholds: {метрика: порог} для report_threshold; по умолчанию DEFAULT_REPORT_THRESHOLD
+        :param offset: Смещение местного времени от UTC; по умолчанию берётся из часового пояса системы
+        :return: Список (заголовок раздела, список словарей)
+        """
+        if offset is None:
+            offset = time.localtime(end).tm_gmtoff
+        thresholds = thresholds or {}
+        return [
+            ("По суткам", SQLiteHandler.report_daily(start, end, host, offset)),
+            ("По часам суток", SQLiteHandler.report_peak_hours(start, end, host, offset)),
+            ("Выше порога", [
+                SQLiteHandler.report_threshold(m, thresholds.get(m, DEFAULT_REPORT_THRESHOLD), start, end, host)
+                for m in THRESHOLD_COLUMNS
+            ]),
+            ("Оповещения", SQLiteHandler.report_alerts(start, end, host, offset)),
+        ]
+
+
+class UsageWriter(threading.Thread):
+    """Фоновая запись показаний в system_usage пачками через очередь.
+
+    Пачка сбрасывается, когда набирается batch_size строк или проходит
+    flush_interval секунд. Каждое показание помечается порядковым номером;
+    номера не больше high_water уже записаны и повторно не вставляются.
+    Раз в PRUNE_INTERVAL секунд удаляются сырые строки старше retention_days
+    (0 или None — хранить всё). Если задан journal, вместе с каждой пачкой
+    в journal_state отмечается номер последнего записанного показания.
+    Оповещения из put_alerts пишутся вместе с ближайшей пачкой.
+
+    Ошибка SQLite (например, «database is locked», пока базу держит другой
+    процесс) поток не останавливает: пачка остаётся в памяти и пишется
+    повторно через RETRY_DELAY, 2 * RETRY_DELAY... (не чаще MAX_RETRY_DELAY),
+    а текст ошибки лежит в error, пока запись не пройдёт.
+    """
+
+    PRUNE_INTERVAL = 3600
+    RETRY_DELAY = 1.0
+    MAX_RETRY_DELAY = 60.0
+
+    def __init__(self, batch_size=500, flush_interval=5.0, retention_days=DEFAULT_RAW_RETENTION_DAYS, journal=None):
+        super().__init__(name="usage-writer", daemon=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.journal = journal
+        self.high_water = 0
+        self.error = None
+        self.errors = 0
+        self._retry_delay = 0
+        self._next_prune = time.monotonic()
+        self._queue = queue.Queue()
+        self._alerts = deque()
+
+    def put(self, seq, row):
+        self._queue.put((seq, [row], None))
+
+    def put_many(self, seq, rows, on_commit=None):
+        """
+        Ставит в очередь готовую пачку строк под одним порядковым номером
+
+        :param on_commit: Вызывается из потока записи без аргументов, когда транзакция с этими строками
+                          завершилась (для повторной пачки — с ближайшей успешной записью)
+        """
+        self._queue.put((seq, rows, on_commit))
+
+    def put_alerts(self, alerts):
+        self._alerts.extend(alerts)
+
+    def flush(self, timeout=None):
+        """Дожидается записи всего, что было поставлено в очередь до вызова; False, если не дождался"""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def stop(self, timeout=5.0):
+        self._queue.put(None)
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        batch, alerts = [], []
+        # flush() и on_commit, которые ждут записи ещё не записанной пачки
+        waiting, committing = [], []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = ()
+
+            if isinstance(item, tuple) and item:
+                seq, rows, on_commit = item
+                if seq > self.high_water:
+                    batch.extend(rows)
+                    self.high_water = seq
+                if on_commit is not None:
+                    committing.append(on_commit)
+                # после ошибки следующая попытка ждёт своего срока, сколько бы строк ни набралось
+                if len(batch) < self.batch_size or self._retry_delay:
+                    continue
+            elif isinstance(item, threading.Event):
+                waiting.append(item)
+
+            if self._write(batch, alerts):
+                for done in waiting:
+                    done.set()
+                for on_commit in committing:
+                    on_commit()
+                waiting, committing = [], []
+            deadline = time.monotonic() + (self._retry_delay or self.flush_interval)
+            if item is None:
+                # недописанное осталось в журнале и будет восстановлено при следующем запуске
+                break
+        SQLiteHandler.close_connection()
+
+    def _write(self, batch, alerts):
+        """
+        Пишет пачку и накопившиеся оповещения (записанное из batch и alerts удаляется)
+        и при необходимости чистит старые показания
+        """
+        METRICS.set_gauge("db.queue_depth", self._queue.qsize())
+        try:
+            if batch:
+                METRICS.set_gauge("db.batch_rows", len(batch))
+                mark = None if self.journal is None else (self.journal.name, self.journal.session, self.high_water)
+                with METRICS.timed("db.flush"):
+                    SQLiteHandler.insert_usage_many(batch, mark)
+                batch.clear()
+                if self.journal is not None:
+                    self.journal.flush()
+            while self._alerts:
+                alerts.append(self._alerts.popleft())
+            if alerts:
+                SQLiteHandler.insert_alerts(alerts)
+                alerts.clear()
+            if self.retention_days and time.monotonic() >= self._next_prune:
+                SQLiteHandler.prune_usage(self.retention_days)
+                self._next_prune = time.monotonic() + self.PRUNE_INTERVAL
+        except sqlite3.Error as e:
+            self.error = str(e)
+            self.errors += 1
+            self._retry_delay = min(self._retry_delay * 2 or self.RETRY_DELAY, self.MAX_RETRY_DELAY)
+            METRICS.set_gauge("db.write_errors", self.errors)
+            METRICS.set_gauge("db.last_error", self.error)
+            return False
+        self.error = None
+        self._retry_delay = 0
+        return True
@@ -0,0 +1,44 @@
+import numpy as np
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: оставляет n_out точек, сохраняющих форму ряда и его пики.
+
+    Первая и последняя точки сохраняются, остальные делятся на n_out - 2 корзины;
+    из каждой выбирается точка, образующая наибольший треугольник с точкой,
+    выбранной в предыдущей корзине, и средним следующей. Внутри корзины
+    расчёт векторизован, поэтому цикл идёт только по корзинам.
+
+    :return: Кортеж (x, y) длиной n_out
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # средние по корзинам считаются сразу для всех корзин через накопленные суммы
+    cum_x = np.concatenate([[0.0], np.cumsum(x)])
+    cum_y = np.concatenate([[0.0], np.cumsum(y)])
+    next_start = edges[1:]
+    next_end = np.maximum(np.append(edges[2:], n), next_start + 1)
+    counts = next_end - next_start
+    avg_x = (cum_x[next_end] - cum_x[next_start]) / counts
+    avg_y = (cum_y[next_end] - cum_y[next_start]) / counts
+
+    index = np.empty(n_out, dtype=np.int64)
+    index[0] = 0
+    index[-1] = n - 1
+    a = 0
+    for k in range(n_out - 2):
+        start, end = edges[k], edges[k + 1]
+        if end <= start:
+            end = start + 1
+        bx = x[start:end]
+        by = y[start:end]
+        area = np.abs((x[a] - avg_x[k]) * (by - y[a]) - (x[a] - bx) * (avg_y[k] - y[a]))
+        a = start + int(area.argmax())
+        index[k + 1] = a
+    return x[index], y[index]
@@ -0,0 +1,180 @@
+import csv
+import io
+import json
+import os
+import struct
+from datetime import datetime
+
+import numpy as np
+
+from ringbuffer import SampleBuffer
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+CSV_FIELDS = ["time", *SampleBuffer.COLUMNS]
+CHUNK_SIZE = 10000
+
+# Бинарный формат .smp: заголовок, затем столбцы подряд (time int64, метрики float64).
+# Заголовок: магия, версия, число строк, длина JSON со списком метрик, сам JSON;
+# всё выровнено до HEADER_ALIGN байт, чтобы столбцы можно было отобразить через np.memmap.
+BINARY_MAGIC = b"SMPL"
+BINARY_VERSION = 1
+HEADER_ALIGN = 64
+_HEADER = struct.Struct("<4sIQI")
+
+
+class Cancelled(Exception):
+    """Операция прервана пользователем"""
+
+
+def _report(progress, cancel, fraction):
+    if cancel is not None and cancel.is_set():
+        raise Cancelled()
+    if progress is not None:
+        progress(fraction)
+
+
+def export_csv(filename, times, columns, progress=None, cancel=None):
+    """
+    Пишет показания в CSV порциями по CHUNK_SIZE строк.
+
+    :param times: Массив времени (секунды эпохи)
+    :param columns: Словарь {метрика: массив значений}
+    :param progress: Функция, получающая долю выполнения от 0 до 1
+    :param cancel: threading.Event; если установлен, бросается Cancelled
+    """
+    total = len(times)
+    names = list(columns)
+    with open(filename, mode="w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["time", *names])
+        for start in range(0, total, CHUNK_SIZE):
+            end = min(start + CHUNK_SIZE, total)
+            stamps = [datetime.fromtimestamp(t).strftime(TIME_FORMAT) for t in times[start:end].tolist()]
+            values = [columns[name][start:end].tolist() for name in names]
+            writer.writerows(zip(stamps, *values))
+            _report(progress, cancel, end / total)
+    return total
+
+
+def import_csv(filename, progress=None, cancel=None):
+    """
+    Читает CSV порциями; строки с некорректными данными пропускаются.
+
+    :return: Кортеж (SampleBuffer, число пропущенных строк)
+    """
+    size = os.path.getsize(filename) or 1
+    times, values = [], {name: [] for name in SampleBuffer.COLUMNS}
+    chunks_time, chunks = [], {name: [] for name in SampleBuffer.COLUMNS}
+    skipped = 0
+
+    def flush_chunk():
+        chunks_time.append(np.array(times, dtype=np.int64))
+        times.clear()
+        for name, column in values.items():
+            chunks[name].append(np.array(column, dtype=np.float64))
+            column.clear()
+
+    with open(filename, mode="rb") as raw:
+        reader = csv.DictReader(io.TextIOWrapper(raw, encoding="utf-8", newline=""))
+        for row in reader:
+            try:
+                parsed = [float(row[name]) for name in SampleBuffer.COLUMNS]
+                stamp = int(datetime.strptime(row["time"], TIME_FORMAT).timestamp())
+            except (KeyError, TypeError, ValueError):
+                skipped += 1
+                continue
+            times.append(stamp)
+            for name, value in zip(SampleBuffer.COLUMNS, parsed):
+                values[name].append(value)
+            if len(times) >= CHUNK_SIZE:
+                flush_chunk()
+                _report(progress, cancel, raw.tell() / size)
+    flush_chunk()
+    _report(progress, cancel, 1.0)
+
+    buffer = SampleBuffer.from_arrays(
+        np.concatenate(chunks_time),
+        {name: np.concatenate(parts) for name, parts in chunks.items()}
+    )
+    return buffer, skipped
+
+
+def _header_size(names_json):
+    size = _HEADER.size + len(names_json)
+    return (size + HEADER_ALIGN - 1) // HEADER_ALIGN * HEADER_ALIGN
+
+
+def export_binary(filename, times, columns, progress=None, cancel=None):
+    """Пишет показания в столбцовый бинарный формат .smp"""
+    names_json = json.dumps(list(columns)).encode("utf-8")
+    header = _HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(times), len(names_json)) + names_json
+    with open(filename, "wb") as f:
+        f.write(header.ljust(_header_size(names_json), b"\0"))
+        np.ascontiguousarray(times, dtype="<i8").tofile(f)
+        for k, name in enumerate(columns, start=1):
+            _report(progress, cancel, k / (len(columns) + 1))
+            np.ascontiguousarray(columns[name], dtype="<f8").tofile(f)
+    _report(progress, cancel, 1.0)
+    return len(times)
+
+
+def open_binary(filename):
+    """
+    Отображает файл .smp в память без чтения и разбора.
+
+    :return: Кортеж (times, {метрика: значения}) из массивов np.memmap только для чтения
+    """
+    with open(filename, "rb") as f:
+        magic, version, count, names_length = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != BINARY_MAGIC or version != BINARY_VERSION:
+            raise ValueError("Файл не является выгрузкой показаний нужной версии")
+        names_json = f.read(names_length)
+    names = json.loads(names_json)
+
+    offset = _header_size(names_json)
+    times = np.memmap(filename, dtype="<i8", mode="r", offset=offset, shape=(count,)) if count else np.empty(0, "<i8")
+    offset += count * 8
+    columns = {}
+    for name in names:
+        columns[name] = np.memmap(filename, dtype="<f8", mode="r", offset=offset, shape=(count,)) if count \
+            else np.empty(0, "<f8")
+        offset += count * 8
+    return times, columns
+
+
+def import_binary(filename, progress=None, cancel=None):
+    """:return: Кортеж (SampleBuffer, 0) — в бинарном формате некорректных строк не бывает"""
+    times, columns = open_binary(filename)
+    _report(progress, cancel, 0.5)
+    buffer = SampleBuffer.from_arrays(
+        times, {name: columns.get(name, np.zeros(len(times))) for name in SampleBuffer.COLUMNS}
+    )
+    _report(progress, cancel, 1.0)
+    return buffer, 0
+
+
+def _report_cell(name, value):
+    if name == "day":
+        return datetime.fromtimestamp(value).strftime("%Y-%m-%d")
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return value
+
+
+def export_report(filename, sections, progress=None, cancel=None):
+    """
+    Пишет разделы отчёта в один CSV: название раздела, строка с именами столбцов, строки, пустая строка
+
+    :param sections: Список (название, список словарей), как у SQLiteHandler.build_report
+    """
+    with open(filename, mode="w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        for i, (title, rows) in enumerate(sections, start=1):
+            writer.writerow([title])
+            if rows:
+                names = list(rows[0])
+                writer.writerow(names)
+                writer.writerows([_report_cell(name, row[name]) for name in names] for row in rows)
+            writer.writerow([])
+            _report(progress, cancel, i / len(sections))
+    return sum(len(rows) for _, rows in sections)
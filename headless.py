@@ -0,0 +1,142 @@
+import argparse
+import json
+import signal
+import socket
+import sys
+import threading
+
+from alerts import AnomalyDetector
+from collector import Collector, RowBuilder
+from components import SystemMonitor
+from db import LOCAL_HOST, USAGE_COLUMNS, SQLiteHandler, UsageWriter
+from journal import Journal, JournalLocked, journal_path
+from metrics import METRICS
+from replay import REPLAY_HOST, Replayer, open_source
+
+# совпадает с http_api.DEFAULT_ADDRESS; сам модуль загружается только с --http
+DEFAULT_HTTP_ADDRESS = "127.0.0.1:9180"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Сбор показаний SystemMonitor в SQLite без графического интерфейса "
+                    "(PyQt6 и matplotlib не загружаются)"
+    )
+    parser.add_argument("--db", default=SQLiteHandler.DB_FILE, help="Путь к файлу базы данных")
+    parser.add_argument("--duration", type=float, default=None, help="Остановиться через столько секунд")
+    parser.add_argument("--retention-days", type=float, default=None,
+                        help="Сколько дней хранить сырые показания (по умолчанию из настроек)")
+    parser.add_argument("--print", dest="echo", action="store_true", help="Печатать показания в stdout")
+    parser.add_argument("--push", default=None, metavar="ADDRESS",
+                        help="Режим агента: отправлять показания сборщику (хост:порт или unix:путь) вместо записи в БД")
+    parser.add_argument("--host-name", default=socket.gethostname(), help="Имя этой машины для сборщика")
+    parser.add_argument("--replay", default=None, metavar="SOURCE",
+                        help="Вместо опроса системы воспроизвести показания: synthetic, db, db:<хост> или путь "
+                             "к .csv/.smp; пишутся в БД под хостом replay")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Ускорение воспроизведения (1–1000, 0 — без пауз)")
+    parser.add_argument("--http", nargs="?", const=DEFAULT_HTTP_ADDRESS, default=None, metavar="ADDRESS",
+                        help=f"Отдавать текущие показания и историю по HTTP (по умолчанию {DEFAULT_HTTP_ADDRESS})")
+    parser.add_argument("--metrics", default=None, help="Включить диагностику и сохранить её в этот JSON при выходе")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.metrics:
+        METRICS.enabled = True
+
+    journal = None
+    if args.push:
+        from remote import Agent
+        # воспроизведённые показания и у сборщика не должны смешиваться с настоящими показаниями этой машины
+        writer = Agent(args.push, REPLAY_HOST if args.replay else args.host_name)
+    else:
+        SQLiteHandler.DB_FILE = args.db
+        SQLiteHandler.init_db()
+        # журнал открывается и при воспроизведении — чтобы дописать в БД остаток прошлого сеанса
+        try:
+            journal = Journal(journal_path(args.db, "headless"))
+        except JournalLocked as e:
+            print(f"{e} — работа без журнала", file=sys.stderr, flush=True)
+        else:
+            if journal.rotated:
+                print(f"Журнал повреждён и отложен в {journal.rotated}, начат новый", file=sys.stderr, flush=True)
+            if journal.restored:
+                print(f"Восстановлено показаний из журнала: {journal.restored}", file=sys.stderr, flush=True)
+            if args.replay:
+                journal.close()
+                journal = None
+        retention_days = args.retention_days
+        if retention_days is None:
+            retention_days = SQLiteHandler.fetch_retention_days()
+        writer = UsageWriter(retention_days=retention_days, journal=journal)
+    writer.start()
+    builder = RowBuilder()
+    detector = None if args.push else AnomalyDetector.from_settings(SQLiteHandler.fetch_settings())
+    snapshot = api = None
+    if args.http:
+        # asyncio и ssl, которые тянет http_api, нужны только с --http: без него запуск быстрее
+        from http_api import ApiServer, Snapshot
+        snapshot = Snapshot()
+        api = ApiServer(snapshot, args.http)
+        api.start()
+        print(f"HTTP: http://{api.address}/api/current", file=sys.stderr, flush=True)
+    seq = 0
+
+    def on_sample(timestamp, usage):
+        nonlocal seq
+        row = builder.build(usage)
+        if row is None:
+            return
+        seq += 1
+        row["time"] = timestamp
+        if args.replay:
+            row["host"] = REPLAY_HOST
+        if args.push:
+            writer.put(row)
+        else:
+            if journal is not None:
+                journal.append(seq, timestamp, row)
+            writer.put(seq, row)
+            alerts = detector.process(timestamp, row, row.get("host", LOCAL_HOST))
+            writer.put_alerts(alerts)
+            for alert in alerts:
+                print(f"[{alert['metric']}] {alert['message']}", file=sys.stderr, flush=True)
+        if snapshot is not None:
+            snapshot.update(timestamp, {name: row[name] for name in USAGE_COLUMNS}, usage.get("stale", ()),
+                            row.get("host", LOCAL_HOST))
+        if args.echo:
+            print(json.dumps(dict(row, stale=usage.get("stale", [])), ensure_ascii=False), flush=True)
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    monitor = None
+    if args.replay:
+        collector = Replayer(open_source(args.replay), on_sample, speed=args.speed)
+    else:
+        monitor = SystemMonitor()
+        collector = Collector(monitor, on_sample, consumers=set(RowBuilder.SOURCES))
+
+    collector.start()
+    if args.replay:
+        # конечный источник заканчивается сам — тогда завершается и сбор
+        threading.Thread(target=lambda: (collector.join(), stopped.set()), daemon=True).start()
+    stopped.wait(args.duration)
+    collector.stop()
+    if monitor is not None:
+        monitor.close()
+    if api is not None:
+        api.stop()
+    writer.stop()
+    if args.replay:
+        print(json.dumps(collector.report()), file=sys.stderr, flush=True)
+    if journal is not None and not writer.is_alive():
+        journal.close()
+    if args.metrics:
+        METRICS.dump(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from db import LOCAL_HOST, ROLLUPS, USAGE_COLUMNS, SQLiteHandler
+from metrics import METRICS
+
+RAW = "raw"
+# ширина плитки в точках: диапазон делится на плитки, которые читаются и кешируются целиком,
+# поэтому при прокрутке запрашиваются только новые плитки на краю окна
+TILE_POINTS = 1024
+# шаг сырых показаний считается секундным, агрегатов — равным размеру корзины
+STEPS = {RAW: 1, **ROLLUPS}
+
+
+def choose_resolution(start, end, pixels):
+    """
+    Самое грубое разрешение, у которого на пиксель приходится не меньше одной точки
+
+    :return: RAW или ключ ROLLUPS
+    """
+    per_pixel = (end - start) / max(pixels, 1)
+    resolution = RAW
+    for name, seconds in sorted(ROLLUPS.items(), key=lambda item: item[1]):
+        if seconds <= per_pixel:
+            resolution = name
+    return resolution
+
+
+class Tile:
+    """Участок истории одного разрешения: время и по каждой метрике минимум, среднее и максимум"""
+
+    __slots__ = ("times", "low", "mean", "high")
+
+    def __init__(self, times, low, mean, high):
+        self.times = times
+        self.low = low
+        self.mean = mean
+        self.high = high
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, np.int64), *({name: np.empty(0) for name in USAGE_COLUMNS} for _ in range(3)))
+
+    def __len__(self):
+        return len(self.times)
+
+
+def load_tile(host, resolution, start, end):
+    """Читает плитку из SQLite: сырые показания (из архива и system_usage) или агрегаты usage_<resolution>"""
+    if resolution == RAW:
+        parts = list(SQLiteHandler.fetch_archive_blocks(start, end, host))
+        rows = list(SQLiteHandler.fetch_usage_range(start, end, host=host))
+        if rows:
+            table = np.array(rows, dtype=np.float64)
+            parts.append((table[:, 0].astype(np.int64),
+                          {name: table[:, i] for i, name in enumerate(USAGE_COLUMNS, start=1)}))
+        if not parts:
+            return Tile.empty()
+        # опоздавшие показания могут лежать в system_usage среди времён, уже ушедших в архив
+        times = np.concatenate([times for times, _ in parts])
+        order = np.argsort(times, kind="stable")
+        values = {name: np.concatenate([columns[name] for _, columns in parts])[order] for name in USAGE_COLUMNS}
+        return Tile(times[order], values, values, values)
+
+    rows = list(SQLiteHandler.fetch_rollup_range(resolution, start, end, host=host))
+    if not rows:
+        return Tile.empty()
+    # столбцы: bucket, count, затем min, max, avg по каждой метрике
+    table = np.array(rows, dtype=np.float64)
+    low, mean, high = {}, {}, {}
+    for i, name in enumerate(USAGE_COLUMNS):
+        base = 2 + i * 3
+        low[name] = table[:, base]
+        high[name] = table[:, base + 1]
+        mean[name] = table[:, base + 2]
+    return Tile(table[:, 0].astype(np.int64), low, mean, high)
+
+
+class HistoryCache:
+    """LRU плиток истории по ключу (хост, разрешение, номер плитки), общий для всех запросов окна.
+
+    Плитки, которые ещё могут пополниться (их конец в будущем), в кеш не
+    попадают и перечитываются при каждом запросе. Показания могут прийти и
+    в закрытую плитку — от агента после обрыва связи, при воспроизведении
+    или восстановлении журнала, в том числе из другого процесса, — поэтому
+    вместе с плиткой хранится число показаний в её диапазоне, и при каждом
+    попадании оно сверяется с БД запросом по индексу.
+    """
+
+    def __init__(self, max_tiles=256):
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def tile(self, host, resolution, index):
+        key = (host, resolution, index)
+        width = TILE_POINTS * STEPS[resolution]
+        start = index * width
+        closed = start + width <= time.time()
+        # считается до чтения плитки: показания, дописанные между ними, заставят перечитать её в следующий раз
+        count = SQLiteHandler.fetch_sample_count(
+            start, start + width, host, None if resolution == RAW else resolution
+        ) if closed else None
+        with self._lock:
+            cached = self._tiles.get(key)
+            if cached is not None and cached[1] == count:
+                self._tiles.move_to_end(key)
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+
+        tile = load_tile(host, resolution, start, start + width)
+        if closed:
+            with self._lock:
+                self._tiles[key] = (tile, count)
+                while len(self._tiles) > self.max_tiles:
+                    self._tiles.popitem(last=False)
+        return tile
+
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+
+    def query(self, start, end, pixels, host=LOCAL_HOST):
+        """
+        Показания окна [start, end), прореженные до ширины холста
+
+        :param pixels: Ширина холста в пикселях — от неё зависит разрешение
+        :return: (разрешение, Tile) не длиннее pixels точек
+        """
+        resolution = choose_resolution(start, end, pixels)
+        with METRICS.timed(f"history.{resolution}"):
+            tile = self._collect(host, resolution, start, end)
+            if resolution == RAW and not len(tile):
+                # показаний нет ни в system_usage, ни в архиве (например, база до появления архива) —
+                # остаются минутные агрегаты
+                resolution = "1m"
+                tile = self._collect(host, resolution, start, end)
+        if len(tile) > pixels:
+            tile = bucketize(tile, int(start), int(end), pixels)
+        return resolution, tile
+
+    def _collect(self, host, resolution, start, end):
+        width = TILE_POINTS * STEPS[resolution]
+        # агрегаты корзины хранятся по её началу, поэтому захватывается корзина, в которую попал start
+        start = int(start) - int(start) % STEPS[resolution]
+        tiles = [self.tile(host, resolution, index) for index in range(start // width, int(end) // width + 1)]
+        tiles = [tile for tile in tiles if len(tile)]
+        if not tiles:
+            return Tile.empty()
+        times = np.concatenate([tile.times for tile in tiles])
+        lo, hi = np.searchsorted(times, start), np.searchsorted(times, end)
+        parts = []
+        for field in ("low", "mean", "high"):
+            parts.append({
+                name: np.concatenate([getattr(tile, field)[name] for tile in tiles])[lo:hi] for name in USAGE_COLUMNS
+            })
+        return Tile(times[lo:hi], *parts)
+
+
+def bucketize(tile, start, end, buckets):
+    """
+    Сводит точки плитки в buckets равных интервалов времени: минимум минимумов, среднее средних,
+    максимум максимумов
+    """
+    index = (tile.times - start) * buckets // max(end - start, 1)
+    # показания отсортированы по времени, поэтому номера интервалов не убывают и reduceat хватает начал групп
+    starts = np.flatnonzero(np.concatenate([[True], np.diff(index) > 0]))
+    counts = np.diff(np.append(starts, len(index)))
+    low, mean, high = {}, {}, {}
+    for name in USAGE_COLUMNS:
+        low[name] = np.minimum.reduceat(tile.low[name], starts)
+        high[name] = np.maximum.reduceat(tile.high[name], starts)
+        mean[name] = np.add.reduceat(tile.mean[name], starts) / counts
+    return Tile(tile.times[starts], low, mean, high)
@@ -0,0 +1,276 @@
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import sqlite3
+import threading
+import time
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from db import LOCAL_HOST, ROLLUP_FIELDS, ROLLUPS, USAGE_COLUMNS, SQLiteHandler
+from metrics import METRICS
+
+DEFAULT_ADDRESS = "127.0.0.1:9180"
+HISTORY_CHUNK_ROWS = 1000
+DEFAULT_HISTORY_SECONDS = 3600
+# сколько истории читается из БД одновременно; остальные запросы истории ждут очереди
+MAX_HISTORY_STREAMS = 4
+# сколько готовых порций истории ждут отправки, пока чтение из БД приостановлено
+HISTORY_QUEUE_CHUNKS = 4
+MAX_CONNECTIONS = 1024
+# простаивающее keep-alive соединение закрывается через столько секунд
+KEEPALIVE_TIMEOUT = 15.0
+MAX_HEADER_BYTES = 16 * 1024
+
+
+class Snapshot:
+    """Последнее показание, заранее сериализованное в JSON вместе с ETag.
+
+    update вызывается из потока сбора один раз за тик; запросы только читают
+    готовую пару (etag, body), поэтому сотни опрашивающих клиентов не
+    сериализуют данные заново и не задерживают тик.
+    """
+
+    def __init__(self):
+        # ETag уникален для запуска, чтобы после перезапуска клиент не получил 304 на чужие данные
+        self._session = f"{int(time.time() * 1000):x}"
+        self._seq = 0
+        self._current = (f'"{self._session}-0"', b"{}")
+
+    def update(self, timestamp, row, stale=(), host=LOCAL_HOST):
+        self._seq += 1
+        body = json.dumps(dict(row, time=timestamp, host=host, stale=list(stale))).encode()
+        self._current = (f'"{self._session}-{self._seq}"', body)
+
+    def get(self):
+        return self._current
+
+
+def history_rows(query):
+    """
+    Параметры: start, end (секунды эпохи; по умолчанию последний час), host,
+    columns (через запятую), resolution (raw или ключ ROLLUPS).
+
+    :return: (имена столбцов, итератор строк); ошибки в параметрах — ValueError
+    """
+    def param(name, default=None):
+        return query.get(name, [default])[0]
+
+    end = int(param("end", time.time() + 1))
+    start = int(param("start", end - DEFAULT_HISTORY_SECONDS))
+    host = param("host", LOCAL_HOST)
+    columns = tuple(param("columns", ",".join(USAGE_COLUMNS)).split(","))
+    resolution = param("resolution", "raw")
+    if resolution == "raw":
+        names = ["time", *columns]
+        # старые показания лежат в архиве, остальные — в system_usage
+        rows = itertools.chain(
+            SQLiteHandler.fetch_archive_range(start, end, columns, host),
+            SQLiteHandler.fetch_usage_range(start, end, columns, HISTORY_CHUNK_ROWS, host),
+        )
+    elif resolution in ROLLUPS:
+        names = ["bucket", "count", *(f"{m}_{f}" for m in columns for f in ROLLUP_FIELDS)]
+        rows = SQLiteHandler.fetch_rollup_range(resolution, start, end, columns, host)
+    else:
+        raise ValueError(f"Неизвестное разрешение: {resolution}")
+    # ошибки в параметрах всплывают при первом чтении генератора — до отправки заголовков
+    first = next(rows, None)
+    return names, rows if first is None else itertools.chain([first], rows)
+
+
+def db_error_status(e):
+    # «database is locked» и подобное проходит само — клиенту стоит повторить запрос
+    if isinstance(e, sqlite3.OperationalError):
+        return HTTPStatus.SERVICE_UNAVAILABLE
+    return HTTPStatus.INTERNAL_SERVER_ERROR
+
+
+class ApiServer(threading.Thread):
+    """HTTP-сервер текущих показаний и истории на asyncio в отдельном потоке.
+
+    Все соединения обслуживает один цикл событий, поэтому сотни
+    опрашивающих клиентов не занимают по потоку и не отнимают GIL у сбора
+    и интерфейса: /api/current отдаёт готовый Snapshot прямо из цикла.
+    История читается из SQLite в пуле из MAX_HISTORY_STREAMS потоков и
+    отдаётся порциями (chunked); пока клиент не забрал очередные порции,
+    чтение приостанавливается.
+    """
+
+    def __init__(self, snapshot, address=DEFAULT_ADDRESS):
+        super().__init__(name="http-api", daemon=True)
+        self.snapshot = snapshot
+        host, _, port = address.rpartition(":")
+        self._loop = asyncio.new_event_loop()
+        self._pool = concurrent.futures.ThreadPoolExecutor(MAX_HISTORY_STREAMS, thread_name_prefix="http-history")
+        # открытые соединения: writer -> задача, которая его обслуживает
+        self._connections = {}
+        # сокет открывается сразу, чтобы ошибка адреса (OSError) досталась вызывающему
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self.handle, host or "127.0.0.1", int(port), backlog=256, limit=MAX_HEADER_BYTES)
+        )
+
+    @property
+    def address(self):
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"{host}:{port}"
+
+    def run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+        self._loop.close()
+
+    def stop(self, timeout=2.0):
+        async def shutdown():
+            self._server.close()
+            # простаивающие keep-alive соединения иначе ждали бы KEEPALIVE_TIMEOUT; после закрытия сокета
+            # обработчики сами завершаются на ошибке чтения или записи
+            for writer in list(self._connections):
+                writer.close()
+            if self._connections:
+                await asyncio.wait(list(self._connections.values()), timeout=timeout / 2)
+            self._loop.stop()
+
+        if self.is_alive():
+            asyncio.run_coroutine_threadsafe(shutdown(), self._loop)
+            self.join(timeout)
+        else:
+            self._server.close()
+            self._loop.close()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    async def handle(self, reader, writer):
+        if len(self._connections) >= MAX_CONNECTIONS:
+            writer.close()
+            return
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while await self.handle_request(reader, writer):
+                pass
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError,
+                ConnectionError):
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    async def handle_request(self, reader, writer):
+        """Обслуживает один запрос; возвращает True, если соединение остаётся открытым для следующего"""
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_TIMEOUT)
+        request_line, *header_lines = head.decode("latin-1").split("\r\n")
+        method, target, version = request_line.split(" ")
+        headers = {}
+        for line in header_lines:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+
+        if method != "GET":
+            await self.send_json(writer, HTTPStatus.METHOD_NOT_ALLOWED, {"error": "method not allowed"}, False)
+            return False
+        url = urlsplit(target)
+        if url.path == "/api/current":
+            etag, body = self.snapshot.get()
+            if headers.get("if-none-match") == etag:
+                await self.send(writer, HTTPStatus.NOT_MODIFIED, {"ETag": etag, "Cache-Control": "no-cache"}, b"",
+                                keep_alive)
+            else:
+                await self.send(writer, HTTPStatus.OK, {
+                    "ETag": etag, "Cache-Control": "no-cache", "Content-Type": "application/json; charset=utf-8",
+                }, body, keep_alive)
+        elif url.path == "/api/metrics":
+            await self.send_json(writer, HTTPStatus.OK, METRICS.snapshot(), keep_alive)
+        elif url.path == "/api/history":
+            return await self.send_history(writer, parse_qs(url.query), keep_alive)
+        else:
+            await self.send_json(writer, HTTPStatus.NOT_FOUND, {"error": "not found"}, keep_alive)
+        return keep_alive
+
+    async def send(self, writer, status, headers, body, keep_alive, chunked=False):
+        lines = [f"HTTP/1.1 {status.value} {status.phrase}", "Server: SystemMonitor"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        if chunked:
+            lines.append("Transfer-Encoding: chunked")
+        elif status != HTTPStatus.NOT_MODIFIED:
+            lines.append(f"Content-Length: {len(body)}")
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def send_json(self, writer, status, data, keep_alive):
+        body = json.dumps(data, ensure_ascii=False).encode()
+        await self.send(writer, status, {"Content-Type": "application/json; charset=utf-8"}, body, keep_alive)
+
+    async def send_history(self, writer, query, keep_alive):
+        """Ответ — {"columns": [...], "rows": [[...], ...]}, отдаётся порциями по мере чтения курсора"""
+        chunks = asyncio.Queue(HISTORY_QUEUE_CHUNKS)
+        cancelled = threading.Event()
+        reading = self._loop.run_in_executor(self._pool, self.read_history, query, chunks, cancelled)
+        try:
+            kind, payload = await chunks.get()
+            if kind == "error":
+                status, message = payload
+                await self.send_json(writer, status, {"error": message}, keep_alive)
+                return keep_alive
+
+            await self.send(writer, HTTPStatus.OK, {"Content-Type": "application/json; charset=utf-8"}, b"",
+                            keep_alive, chunked=True)
+            writer.write(self.chunk(f'{{"columns": {json.dumps(payload)}, "rows": ['.encode()))
+            while True:
+                kind, payload = await chunks.get()
+                if kind == "error":
+                    # заголовок 200 уже ушёл: оборванный без последней порции ответ клиент распознает как ошибку
+                    return False
+                if kind == "end":
+                    break
+                writer.write(self.chunk(payload))
+                await writer.drain()
+            writer.write(self.chunk(b"]}") + b"0\r\n\r\n")
+            await writer.drain()
+            return keep_alive
+        finally:
+            cancelled.set()
+            await reading
+
+    @staticmethod
+    def chunk(data):
+        return f"{len(data):X}\r\n".encode() + data + b"\r\n" if data else b""
+
+    def read_history(self, query, chunks, cancelled):
+        """Выполняется в пуле: читает историю из БД и кладёт порции в chunks, ожидая, пока их заберут"""
+        def put(kind, payload=None):
+            future = asyncio.run_coroutine_threadsafe(chunks.put((kind, payload)), self._loop)
+            while not cancelled.is_set():
+                try:
+                    future.result(0.5)
+                    return True
+                except concurrent.futures.TimeoutError:
+                    pass
+            future.cancel()
+            return False
+
+        try:
+            names, rows = history_rows(query)
+        except ValueError as e:
+            put("error", (HTTPStatus.BAD_REQUEST, str(e)))
+            return
+        except sqlite3.Error as e:
+            put("error", (db_error_status(e), str(e)))
+            return
+        if not put("names", names):
+            return
+        separator = b""
+        try:
+            while True:
+                chunk = [json.dumps(row) for row in itertools.islice(rows, HISTORY_CHUNK_ROWS)]
+                if not chunk:
+                    break
+                if not put("rows", separator + ",".join(chunk).encode()):
+                    return
+                separator = b","
+        except sqlite3.Error as e:
+            put("error", (db_error_status(e), str(e)))
+            return
+        put("end")
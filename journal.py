@@ -0,0 +1,151 @@
+import math
+import mmap
+import os
+import struct
+import time
+
+from db import LOCAL_HOST, USAGE_COLUMNS, SQLiteHandler
+
+# Журнал показаний — файл фиксированного размера, отображённый в память:
+#   заголовок HEADER_SIZE байт: магия, версия, ёмкость в записях, номер сеанса;
+#   затем capacity записей RECORD: порядковый номер, время и метрики USAGE_COLUMNS (пустое значение — NaN).
+# Запись с номером seq лежит в слоте seq % capacity, нулевой номер — пустой слот.
+# Какие номера сеанса уже попали в БД, хранится не в файле, а в таблице journal_state.
+# Сторонние программы читают журнал без копирования:
+#   numpy.memmap(path, dtype=NUMPY_DTYPE, mode="r", offset=HEADER_SIZE)
+MAGIC = b"SMJL"
+VERSION = 2
+HEADER = struct.Struct("<4sIIq")
+HEADER_SIZE = 64
+RECORD = struct.Struct("<Qq4f")
+NUMPY_DTYPE = [("seq", "<u8"), ("time", "<i8")] + [(name, "<f4") for name in USAGE_COLUMNS]
+# сутки показаний раз в секунду — с большим запасом больше, чем успевает накопиться между записями в БД
+DEFAULT_CAPACITY = 86400
+
+
+class JournalLocked(OSError):
+    """Журнал уже открыт другим процессом"""
+
+
+def _lock(f):
+    """Исключительная блокировка файла без ожидания; OSError, если она уже взята"""
+    if os.name == "nt":
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+def _open_locked(path):
+    # без O_TRUNC: до взятия блокировки содержимое может принадлежать другому процессу
+    f = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT), "r+b")
+    try:
+        _lock(f)
+    except OSError:
+        f.close()
+        raise JournalLocked(f"{path}: журнал уже используется другим процессом")
+    return f
+
+
+class Journal:
+    """Журнал, в который каждое показание пишется сразу при снятии, без fsync и без SQL.
+
+    Запись — это копирование 32 байт в отображённую память, поэтому при
+    падении процесса данные остаются в страничном кеше ОС и попадают в файл.
+    UsageWriter вместе с каждой пачкой записывает в journal_state номер её
+    последнего показания (в той же транзакции) и сбрасывает отображение на
+    диск (flush).
+
+    Файл блокируется на всё время работы, поэтому второй экземпляр программы
+    не затрёт чужой журнал, а получит JournalLocked. Взяв блокировку, журнал
+    сначала дописывает в БД показания прошлого сеанса с номерами выше
+    отмеченного в journal_state (их число — в restored), и только потом
+    начинает новый сеанс. Повреждённый или чужой файл не восстанавливается,
+    а переименовывается в rotated.
+    """
+
+    def __init__(self, path, capacity=DEFAULT_CAPACITY, host=LOCAL_HOST):
+        self.path = path
+        # журналы лежат рядом с базой, поэтому имени файла достаточно, чтобы отличить их в journal_state
+        self.name = os.path.basename(path)
+        self.capacity = capacity
+        self.restored = 0
+        self.rotated = None
+        size = HEADER_SIZE + capacity * RECORD.size
+        self._file = _open_locked(path)
+        try:
+            self._file.seek(0)
+            try:
+                session, records = _parse(self._file.read(), path)
+            except ValueError:
+                self._file.close()
+                self.rotated = f"{path}.{int(time.time())}.bad"
+                os.replace(path, self.rotated)
+                self._file = _open_locked(path)
+            else:
+                self.restored = _restore(self.name, session, records, host)
+            self._file.truncate(0)
+            self._file.truncate(size)
+            self._mmap = mmap.mmap(self._file.fileno(), size)
+        except BaseException:
+            # блокировку держит открытый файл: без закрытия журнал остался бы занят до выхода процесса
+            self._file.close()
+            raise
+        # номер сеанса отличает записи этого запуска от прошлых, у которых номера показаний тоже начинались с 1
+        self.session = int.from_bytes(os.urandom(8), "little") >> 1
+        HEADER.pack_into(self._mmap, 0, MAGIC, VERSION, capacity, self.session)
+
+    def append(self, seq, timestamp, row):
+        """:param seq: Порядковый номер показания в сеансе, начиная с 1 (тот же, что у UsageWriter.put)"""
+        RECORD.pack_into(
+            self._mmap, HEADER_SIZE + (seq % self.capacity) * RECORD.size,
+            seq, int(timestamp), *(math.nan if row[name] is None else row[name] for name in USAGE_COLUMNS)
+        )
+
+    def flush(self):
+        """Сбрасывает отображение на диск, чтобы записи пережили и сбой ОС, а не только процесса"""
+        self._mmap.flush()
+
+    def close(self):
+        self._mmap.flush()
+        self._mmap.close()
+        self._file.close()
+
+
+def _parse(data, path):
+    """:return: (номер сеанса, записи журнала с непустыми слотами по возрастанию номера); ValueError — не журнал"""
+    if not data:
+        return 0, []
+    if len(data) < HEADER_SIZE:
+        raise ValueError(f"{path}: файл журнала обрезан")
+    magic, version, capacity, session = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path}: не журнал показаний или неподдерживаемая версия")
+    body = memoryview(data)[HEADER_SIZE:HEADER_SIZE + capacity * RECORD.size]
+    # файл мог быть обрезан посреди записи — неполная запись отбрасывается
+    body = body[:len(body) - len(body) % RECORD.size]
+    records = sorted(record for record in RECORD.iter_unpack(body) if record[0])
+    return session, records
+
+
+def _restore(name, session, records, host):
+    """Дописывает в system_usage показания сеанса, не успевшие попасть в БД до аварийного завершения"""
+    committed = SQLiteHandler.fetch_journal_seq(name, session)
+    records = [record for record in records if record[0] > committed]
+    if not records:
+        return 0
+    rows = [
+        dict({column: None if math.isnan(value) else value for column, value in zip(USAGE_COLUMNS, values)},
+             time=timestamp, host=host)
+        for seq, timestamp, *values in records
+    ]
+    # отметка пишется вместе с показаниями: если упасть до начала нового сеанса, повторно они не вставятся
+    SQLiteHandler.insert_usage_many(rows, (name, session, records[-1][0]))
+    return len(rows)
+
+
+def journal_path(db_file, name):
+    """Журнал лежит рядом с базой; у каждого пишущего процесса (интерфейс, headless) он свой"""
+    return f"{os.path.splitext(db_file)[0]}.{name}.journal"
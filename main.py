@@ -1,51 +1,204 @@
 import sys
-import csv
 import os
-from datetime import datetime
-from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
+import sqlite3
+import threading
+import time
+
+import numpy as np
 
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QTabWidget, QVBoxLayout, QWidget, QPushButton,
-    QFileDialog, QLineEdit, QFormLayout, QMessageBox, QLabel
+    QFileDialog, QLineEdit, QFormLayout, QMessageBox, QLabel, QProgressDialog, QTableWidget, QTableWidgetItem,
+    QCheckBox, QComboBox, QHBoxLayout
 )
-from PyQt6.QtCore import QTimer, Qt
+from PyQt6.QtCore import QObject, QThread, QTimer, Qt, pyqtSignal
 from PyQt6.QtGui import QPixmap
-from psutil import net_io_counters
 
+from alerts import AnomalyDetector
+from collector import Collector, RowBuilder
 from components import SystemMonitor
-from db import SQLiteHandler
+from downsample import lttb
+from db import LOCAL_HOST, SQLiteHandler, UsageWriter
+from fileio import Cancelled, export_binary, export_csv, export_report, import_binary, import_csv
+from history import RAW, HistoryCache
+from http_api import ApiServer, Snapshot
+from journal import Journal, JournalLocked, journal_path
+from metrics import METRICS
+from replay import REPLAY_HOST, SPEEDS, Replayer, open_source
+from ringbuffer import STATS, SampleBuffer
+
+PLOT_WINDOW = 60
+DEFAULT_HISTORY_SIZE = 86400  # сутки показаний при опросе раз в секунду
+MAX_HISTORY_SIZE = 7 * DEFAULT_HISTORY_SIZE
+# компоненты, чьи данные показывает интерфейс; остальные планировщик не опрашивает
+USED_COMPONENTS = {*RowBuilder.SOURCES, "processes", "disk_io"}
+HOST_HISTORY_SECONDS = 86400
+REPORT_DAYS = 90
+# сколько ждать, пока UsageWriter допишет очередь при сохранении в БД
+SAVE_TIMEOUT = 30.0
+FILE_FILTER = "CSV Files (*.csv);;Бинарный формат (*.smp)"
+
+
+def history_size_setting():
+    """Настройка history_size, прижатая к [PLOT_WINDOW, MAX_HISTORY_SIZE]; нечисловое значение — DEFAULT_HISTORY_SIZE"""
+    try:
+        size = int(float(SQLiteHandler.fetch_setting("history_size", DEFAULT_HISTORY_SIZE)))
+    except (TypeError, ValueError, OverflowError):
+        return DEFAULT_HISTORY_SIZE
+    return min(max(size, PLOT_WINDOW), MAX_HISTORY_SIZE)
+
+
+def load_host_samples(host, seconds=HOST_HISTORY_SECONDS, progress=None, cancel=None):
+    """Показания удалённого хоста за последние seconds секунд из БД; сигнатура как у функций fileio"""
+    end = int(time.time()) + 1
+    rows = list(SQLiteHandler.fetch_usage_range(end - seconds, end, host=host))
+    if cancel is not None and cancel.is_set():
+        raise Cancelled()
+    table = np.array(rows, dtype=np.float64).reshape(-1, len(SampleBuffer.COLUMNS) + 1)
+    buffer = SampleBuffer.from_arrays(
+        table[:, 0].astype(np.int64), {name: table[:, i] for i, name in enumerate(SampleBuffer.COLUMNS, start=1)}
+    )
+    if progress is not None:
+        progress(1.0)
+    return buffer, 0
+
+
+def write_report(filename, host, thresholds, progress=None, cancel=None):
+    """Отчёт за последние REPORT_DAYS суток, посчитанный в SQLite; сигнатура как у функций fileio"""
+    end = int(time.time()) + 1
+    sections = SQLiteHandler.build_report(end - REPORT_DAYS * 86400, end, host, thresholds)
+    return export_report(filename, sections, progress, cancel)
+
+
+def save_samples(writer, rows, progress=None, cancel=None):
+    """
+    Сохраняет показания в БД; сигнатура как у функций fileio
+
+    :param rows: Строки импорта или None — тогда только дожидается, пока writer допишет живые показания
+    :return: True, если были сохранены строки импорта
+    """
+    if rows is None:
+        if not writer.flush(SAVE_TIMEOUT):
+            raise OSError(f"Запись в БД не завершилась за {SAVE_TIMEOUT:.0f} с: {writer.error or 'база занята'}")
+    else:
+        SQLiteHandler.insert_usage_many(rows)
+    if cancel is not None and cancel.is_set():
+        raise Cancelled()
+    if progress is not None:
+        progress(1.0)
+    return rows is not None
 
 
 class LivePlot(QWidget):
+    # ось Y сужается, только когда пик окна опустился ниже этой доли текущего предела
+    SHRINK_RATIO = 0.4
+
     def __init__(self, title, ylabel, fixed_ylim=False):
         super().__init__()
-        self.data = [0] * 60
+        self.title = title
+        self.ylabel = ylabel
+        self.x = np.arange(PLOT_WINDOW)
+        self.data = np.zeros(PLOT_WINDOW)
         self.fixed_ylim = fixed_ylim
+        self.background = None
+        # фигура и холст создаются при первом показе вкладки; до этого данные только запоминаются
+        self.canvas = None
+        self.pending_values = None
+        self.setLayout(QVBoxLayout())
+
+    def showEvent(self, event):
+        if self.canvas is None:
+            self.create_canvas()
+        super().showEvent(event)
+
+    def create_canvas(self):
+        from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
+        from matplotlib.figure import Figure
+
         self.fig = Figure(figsize=(5, 3))
         self.canvas = FigureCanvas(self.fig)
         self.ax = self.fig.add_subplot(111)
-        self.ax.set_title(title)
-        if fixed_ylim:
-            self.ax.set_ylim(0, 100)
-        self.ax.set_ylabel(ylabel)
-        self.line, = self.ax.plot(self.data, color="tab:blue")
-        layout = QVBoxLayout()
-        layout.addWidget(self.canvas)
-        self.setLayout(layout)
+        self.ax.set_title(self.title)
+        self.ax.set_ylim(0, 100 if self.fixed_ylim else 1)
+        self.ax.set_ylabel(self.ylabel)
+        # линия рисуется отдельно от остальной фигуры, чтобы на каждом тике перерисовывать только её
+        self.line, = self.ax.plot(self.x, np.zeros(PLOT_WINDOW), color="tab:blue", animated=True)
+        self.canvas.mpl_connect("draw_event", self.on_draw)
+        self.layout().addWidget(self.canvas)
+
+        if self.pending_values is not None:
+            values, self.pending_values = self.pending_values, None
+            self.set_data(values)
+        else:
+            self.update_plot(self.data)
+
+    def set_title(self, title):
+        self.title = title
+        if self.canvas is not None:
+            self.ax.set_title(title)
+            self.canvas.draw_idle()
+
+    def on_draw(self, event):
+        """После полной перерисовки запоминает фон осей и дорисовывает поверх него линию"""
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.ax.draw_artist(self.line)
+
+    def blit(self):
+        if self.background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        self.ax.draw_artist(self.line)
+        self.canvas.blit(self.ax.bbox)
+
+    def rescale(self):
+        """Меняет предел оси Y, только если пик окна вышел за порог; возвращает True при изменении"""
+        if self.fixed_ylim:
+            return False
+        top = self.ax.get_ylim()[1]
+        peak = self.data.max()
+        if peak <= top and (peak * 1.2 >= top * self.SHRINK_RATIO or top <= 1):
+            return False
+        self.ax.set_ylim(0, max(peak * 1.2, 1))
+        return True
 
-    def update_plot(self, new_value):
-        self.data = self.data[1:] + [new_value]
+    def update_plot(self, window):
+        """
+        :param window: Последние PLOT_WINDOW значений метрики (срез SampleBuffer без копирования)
+        """
+        self.data = window
+        if self.canvas is None:
+            self.pending_values = None
+            return
+        full_redraw = False
+        if len(self.line.get_xdata()) != PLOT_WINDOW:
+            self.line.set_xdata(self.x)
+            self.ax.set_xlim(0, PLOT_WINDOW - 1)
+            full_redraw = True
         self.line.set_ydata(self.data)
-        if not self.fixed_ylim:
-            self.ax.set_ylim(0, max(max(self.data) * 1.2, 1))
-        self.canvas.draw_idle()
+        if self.rescale() or full_redraw:
+            self.canvas.draw_idle()
+        else:
+            self.blit()
 
     def set_data(self, values):
-        self.data = values[-60:] if len(values) >= 60 else [0] * (60 - len(values)) + values
-        self.line.set_ydata(self.data)
+        """Показывает весь ряд; длинные ряды прореживаются LTTB примерно до ширины холста в пикселях"""
+        values = np.asarray(values, dtype=np.float64)
+        if self.canvas is None:
+            self.pending_values = values
+            return
+        if len(values) > PLOT_WINDOW:
+            x, self.data = lttb(np.arange(len(values)), values, max(self.canvas.width(), PLOT_WINDOW))
+            self.ax.set_xlim(0, len(values) - 1)
+        else:
+            x = self.x
+            self.data = np.zeros(PLOT_WINDOW)
+            if len(values):
+                self.data[-len(values):] = values
+            self.ax.set_xlim(0, PLOT_WINDOW - 1)
+        self.line.set_data(x, self.data)
         if not self.fixed_ylim:
-            self.ax.set_ylim(0, max(max(self.data) * 1.2, 1))
+            self.ax.set_ylim(0, max(self.data.max() * 1.2, 1))
         self.canvas.draw_idle()
 
 
@@ -53,55 +206,579 @@ class SystemTab(QWidget):
     def __init__(self, title, ylabel):
         super().__init__()
         self.plot = LivePlot(title, ylabel)
+        # вкладка пропустила тики, пока была скрыта, и должна догнать данные при показе
+        self.stale = False
         layout = QVBoxLayout()
         layout.addWidget(self.plot)
         self.setLayout(layout)
 
-    def update(self, value):
-        self.plot.update_plot(value)
+    def update(self, window):
+        self.stale = False
+        self.plot.update_plot(window)
 
     def set_data(self, values):
+        self.stale = False
         self.plot.set_data(values)
 
 
+class RateTab(QWidget):
+    """Скорости по отдельным устройствам (дискам или сетевым интерфейсам) за последние PLOT_WINDOW тиков.
+
+    Для каждого устройства ведётся свой SampleBuffer; графики показывают
+    устройство, выбранное в списке.
+    """
+
+    def __init__(self, series, summary=None):
+        """
+        :param series: Список (ключ показаний, заголовок графика, подпись оси Y)
+        :param summary: Функция, строящая по показаниям устройства строку над графиками
+        """
+        super().__init__()
+        self.columns = tuple(key for key, _, _ in series)
+        self.summary = summary
+        self.buffers = {}
+        self.latest = {}
+        self.device_box = QComboBox()
+        self.device_box.currentTextChanged.connect(lambda _: self.update())
+        self.summary_label = QLabel()
+        self.plots = {key: LivePlot(title, ylabel) for key, title, ylabel in series}
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.device_box)
+        layout.addWidget(self.summary_label)
+        for plot in self.plots.values():
+            layout.addWidget(plot)
+        self.setLayout(layout)
+
+    def append(self, timestamp, devices):
+        """:param devices: {устройство: {ключ: скорость}} — запоминается всегда, даже если вкладка скрыта"""
+        for device, rates in devices.items():
+            buffer = self.buffers.get(device)
+            if buffer is None:
+                buffer = self.buffers[device] = SampleBuffer(PLOT_WINDOW, columns=self.columns)
+                self.device_box.addItem(device)
+            buffer.append(timestamp, rates)
+        self.latest = devices
+
+    def update(self):
+        device = self.device_box.currentText()
+        buffer = self.buffers.get(device)
+        if buffer is None:
+            return
+        if self.summary is not None and device in self.latest:
+            self.summary_label.setText(self.summary(self.latest[device]))
+        for key, plot in self.plots.items():
+            plot.update_plot(buffer.column(key, PLOT_WINDOW))
+
+
+class ProcessTab(QWidget):
+    """Загрузка по ядрам и самые нагружающие систему процессы"""
+
+    HEADERS = ["PID", "Процесс", "CPU, %", "Память, МБ"]
+
+    def __init__(self):
+        super().__init__()
+        self.cores_label = QLabel()
+        self.cores_label.setWordWrap(True)
+        self.cpu_table = self.create_table()
+        self.memory_table = self.create_table()
+        layout = QVBoxLayout()
+        layout.addWidget(self.cores_label)
+        layout.addWidget(QLabel("По загрузке процессора:"))
+        layout.addWidget(self.cpu_table)
+        layout.addWidget(QLabel("По занятой памяти:"))
+        layout.addWidget(self.memory_table)
+        self.setLayout(layout)
+
+    def create_table(self):
+        table = QTableWidget(0, len(self.HEADERS))
+        table.setHorizontalHeaderLabels(self.HEADERS)
+        table.horizontalHeader().setStretchLastSection(True)
+        table.verticalHeader().setVisible(False)
+        table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        return table
+
+    def fill_table(self, table, rows):
+        table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            values = [row["pid"], row["name"], f"{row['cpu_percent']:.1f}", f"{row['rss'] / 2 ** 20:.1f}"]
+            for j, value in enumerate(values):
+                table.setItem(i, j, QTableWidgetItem(str(value)))
+
+    def update(self, usage):
+        cores = "  ".join(f"#{i}: {value:.0f}%" for i, value in enumerate(usage["per_core"]))
+        self.cores_label.setText(f"Ядра: {cores}\nПроцессов: {usage['process_count']}")
+        self.fill_table(self.cpu_table, usage["top_cpu"])
+        self.fill_table(self.memory_table, usage["top_memory"])
+
+
+class StatsTab(QWidget):
+    """Минимум, максимум, среднее и перцентили по каждой метрике за выбранное окно — живых или загруженных данных"""
+
+    WINDOWS = [("Последняя минута", 60), ("5 минут", 300), ("Час", 3600), ("Сутки", 86400), ("Все данные", None)]
+    TITLES = {"cpu": "Процессор, %", "memory": "ОЗУ, %", "gpu": "GPU, %", "network_kb": "Сеть, КБ/с"}
+    HEADERS = ["Кол-во", "Мин", "Макс", "Среднее", "p50", "p95", "p99"]
+
+    def __init__(self):
+        super().__init__()
+        self.buffer = None
+        self.window_box = QComboBox()
+        self.window_box.addItems([title for title, _ in self.WINDOWS])
+        self.window_box.setCurrentIndex(2)
+        self.window_box.currentIndexChanged.connect(lambda _: self.refresh())
+        self.table = QTableWidget(len(SampleBuffer.COLUMNS), len(self.HEADERS))
+        self.table.setHorizontalHeaderLabels(self.HEADERS)
+        self.table.setVerticalHeaderLabels([self.TITLES[name] for name in SampleBuffer.COLUMNS])
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.window_box)
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+    def show_stats(self, buffer):
+        self.buffer = buffer
+        self.refresh()
+
+    def refresh(self):
+        if self.buffer is None or not len(self.buffer):
+            self.table.clearContents()
+            return
+        seconds = self.WINDOWS[self.window_box.currentIndex()][1]
+        # окно отсчитывается от последнего показания, чтобы для загруженного файла оно тоже имело смысл
+        end = int(self.buffer.times(1)[0]) + 1
+        start = None if seconds is None else end - seconds
+        with METRICS.timed("render.stats"):
+            stats = self.buffer.stats(start, end)
+        for i, name in enumerate(SampleBuffer.COLUMNS):
+            for j, field in enumerate(STATS):
+                value = stats[name][field]
+                text = "" if value is None else str(value) if field == "count" else f"{value:.1f}"
+                self.table.setItem(i, j, QTableWidgetItem(text))
+
+
+class HistoryLoader(QThread):
+    """Читает окна истории из SQLite в фоне; из накопившихся запросов выполняется только последний"""
+
+    loaded = pyqtSignal(object)
+
+    def __init__(self, cache):
+        super().__init__()
+        self.cache = cache
+        self._request = None
+        self._stopped = False
+        self._condition = threading.Condition()
+
+    def request(self, host, start, end, pixels):
+        with self._condition:
+            self._request = (host, start, end, pixels)
+            self._condition.notify()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self.wait()
+
+    def run(self):
+        while True:
+            with self._condition:
+                while self._request is None and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    break
+                request, self._request = self._request, None
+            host, start, end, pixels = request
+            resolution, tile = self.cache.query(start, end, pixels, host)
+            self.loaded.emit((request, resolution, tile))
+        SQLiteHandler.close_connection()
+
+
+class HistoryTab(QWidget):
+    """История из БД с прокруткой и масштабом: колесо мыши меняет масштаб, перетаскивание сдвигает окно.
+
+    Для каждого окна читается только нужный диапазон в разрешении, которого
+    хватает на ширину холста; чтение идёт в HistoryLoader, плитки кешируются.
+    """
+
+    TITLES = StatsTab.TITLES
+    MIN_SPAN = 60
+    ZOOM_STEP = 1.5
+
+    def __init__(self):
+        super().__init__()
+        self.host = LOCAL_HOST
+        self.span = 86400
+        self.end = time.time()
+        self.requested = None
+        self.drag_x = None
+        self.canvas = None
+        self.loader = HistoryLoader(HistoryCache())
+        self.loader.loaded.connect(self.show_result)
+        self.loader.start()
+
+        self.metric_box = QComboBox()
+        for name, title in self.TITLES.items():
+            self.metric_box.addItem(title, name)
+        self.metric_box.currentIndexChanged.connect(lambda _: self.request())
+        self.info_label = QLabel()
+        buttons = QHBoxLayout()
+        for title, handler in (("<", lambda: self.pan(-0.5)), (">", lambda: self.pan(0.5)),
+                               ("+", lambda: self.zoom(1 / self.ZOOM_STEP)), ("-", lambda: self.zoom(self.ZOOM_STEP)),
+                               ("Сейчас", self.to_now)):
+            button = QPushButton(title)
+            button.clicked.connect(handler)
+            buttons.addWidget(button)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.metric_box)
+        layout.addLayout(buttons)
+        layout.addWidget(self.info_label)
+        self.setLayout(layout)
+
+    def showEvent(self, event):
+        if self.canvas is None:
+            self.create_canvas()
+        super().showEvent(event)
+        self.request()
+
+    def create_canvas(self):
+        from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
+        from matplotlib.figure import Figure
+        from matplotlib.ticker import FuncFormatter
+
+        self.fig = Figure(figsize=(5, 3))
+        self.canvas = FigureCanvas(self.fig)
+        self.ax = self.fig.add_subplot(111)
+        self.ax.xaxis.set_major_formatter(FuncFormatter(self.format_time))
+        self.canvas.mpl_connect("scroll_event", self.on_scroll)
+        self.canvas.mpl_connect("button_press_event", self.on_press)
+        self.canvas.mpl_connect("motion_notify_event", self.on_motion)
+        self.canvas.mpl_connect("button_release_event", self.on_release)
+        self.layout().addWidget(self.canvas, 1)
+
+    def format_time(self, x, _):
+        return time.strftime("%H:%M" if self.span <= 86400 else "%d.%m %H:%M", time.localtime(x))
+
+    def set_host(self, host):
+        self.host = host
+        self.request()
+
+    def request(self):
+        if self.canvas is None or not self.isVisible():
+            return
+        self.requested = (self.host, self.end - self.span, self.end, max(self.canvas.width(), 100))
+        self.loader.request(*self.requested)
+
+    def show_result(self, result):
+        request, resolution, tile = result
+        if request != self.requested:
+            # окно успело сдвинуться, пока шёл запрос
+            return
+        _, start, end, _ = request
+        name = self.metric_box.currentData()
+        self.ax.cla()
+        if len(tile):
+            if resolution != RAW:
+                self.ax.fill_between(tile.times, tile.low[name], tile.high[name], color="tab:blue", alpha=0.2, lw=0)
+            self.ax.plot(tile.times, tile.mean[name], color="tab:blue")
+        self.ax.set_xlim(start, end)
+        self.ax.set_ylim(bottom=0)
+        self.info_label.setText(
+            f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(start))} — "
+            f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(end))}, "
+            f"разрешение: {'сырые показания' if resolution == RAW else resolution}, точек: {len(tile)}"
+        )
+        self.canvas.draw_idle()
+
+    def pan(self, fraction):
+        self.end += self.span * fraction
+        self.request()
+
+    def zoom(self, factor, center=None):
+        center = self.end - self.span / 2 if center is None else center
+        # точка под курсором остаётся на месте
+        ratio = (self.end - center) / self.span
+        self.span = max(self.span * factor, self.MIN_SPAN)
+        self.end = center + ratio * self.span
+        self.request()
+
+    def to_now(self):
+        self.end = time.time()
+        self.request()
+
+    def on_scroll(self, event):
+        if event.xdata is not None:
+            self.zoom(1 / self.ZOOM_STEP if event.button == "up" else self.ZOOM_STEP, event.xdata)
+
+    def on_press(self, event):
+        self.drag_x = event.xdata
+
+    def on_motion(self, event):
+        if self.drag_x is None or event.xdata is None:
+            return
+        self.end -= event.xdata - self.drag_x
+        # пока идёт запрос, сдвигаются уже нарисованные данные
+        self.ax.set_xlim(self.end - self.span, self.end)
+        self.canvas.draw_idle()
+        self.request()
+
+    def on_release(self, event):
+        self.drag_x = None
+
+
+class DiagnosticsTab(QWidget):
+    """Замеры самого монитора: время опроса, отрисовки и записи в БД, размер очередей и буфера"""
+
+    HEADERS = ["Метрика", "Кол-во", "Среднее, мс", "p50, мс", "p95, мс", "p99, мс", "Макс, мс"]
+    FIELDS = ["count", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+
+    def __init__(self):
+        super().__init__()
+        self.enabled_box = QCheckBox("Собирать диагностику")
+        self.enabled_box.setChecked(METRICS.enabled)
+        self.enabled_box.toggled.connect(self.set_enabled)
+        self.gauges_label = QLabel()
+        self.gauges_label.setWordWrap(True)
+        self.table = QTableWidget(0, len(self.HEADERS))
+        self.table.setHorizontalHeaderLabels(self.HEADERS)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.dump_button = QPushButton("Сохранить в JSON")
+        self.dump_button.clicked.connect(self.dump)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.enabled_box)
+        layout.addWidget(self.gauges_label)
+        layout.addWidget(self.table)
+        layout.addWidget(self.dump_button)
+        self.setLayout(layout)
+
+    def set_enabled(self, enabled):
+        METRICS.enabled = enabled
+        SQLiteHandler.insert_setting("diagnostics", "1" if enabled else "0")
+
+    def update(self):
+        snapshot = METRICS.snapshot()
+        self.gauges_label.setText("\n".join(
+            f"{name}: {value:.1f}" if isinstance(value, float) else f"{name}: {value}"
+            for name, value in snapshot["gauges"].items()
+        ))
+        histograms = snapshot["histograms"]
+        self.table.setRowCount(len(histograms))
+        for i, (name, stats) in enumerate(histograms.items()):
+            self.table.setItem(i, 0, QTableWidgetItem(name))
+            for j, field in enumerate(self.FIELDS, start=1):
+                value = stats.get(field)
+                text = "" if value is None else str(value) if field == "count" else f"{value:.2f}"
+                self.table.setItem(i, j, QTableWidgetItem(text))
+
+    def dump(self):
+        filename, _ = QFileDialog.getSaveFileName(self, "Сохранить диагностику", "", "JSON (*.json)")
+        if filename:
+            METRICS.dump(filename)
+
+
+class AlertsTab(QWidget):
+    """Журнал оповещений: устойчивые превышения порогов и резкие отклонения от обычного уровня"""
+
+    HEADERS = ["Время", "Хост", "Метрика", "Событие"]
+    MAX_ROWS = 500
+
+    def __init__(self):
+        super().__init__()
+        self.table = QTableWidget(0, len(self.HEADERS))
+        self.table.setHorizontalHeaderLabels(self.HEADERS)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        layout = QVBoxLayout()
+        layout.addWidget(QLabel("Пороги задаются настройками alert_cpu, alert_cpu_duration и т.п."))
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+    def add(self, alerts):
+        """Добавляет оповещения в начало таблицы, самые новые сверху"""
+        for alert in alerts:
+            self.table.insertRow(0)
+            values = [
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(alert["time"])),
+                alert["host"], alert["metric"], alert["message"],
+            ]
+            for j, value in enumerate(values):
+                self.table.setItem(0, j, QTableWidgetItem(value))
+        if self.table.rowCount() > self.MAX_ROWS:
+            self.table.setRowCount(self.MAX_ROWS)
+
+
+class SampleBridge(QObject):
+    """Передаёт показания из потока Collector в поток интерфейса через сигнал"""
+
+    sample_ready = pyqtSignal(float, dict)
+
+
+class FileWorker(QThread):
+    """Выполняет импорт или экспорт файла в фоне, сообщая о прогрессе в процентах"""
+
+    progress = pyqtSignal(int)
+    done = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, func, *args):
+        super().__init__()
+        self.func = func
+        self.args = args
+        self.cancel = threading.Event()
+
+    def run(self):
+        try:
+            result = self.func(*self.args, progress=self.report, cancel=self.cancel)
+        except Cancelled:
+            return
+        except (OSError, ValueError, sqlite3.Error) as e:
+            self.failed.emit(str(e))
+            return
+        self.done.emit(result)
+
+    def report(self, fraction):
+        self.progress.emit(int(fraction * 100))
+
+
 class SystemInfoApp(QMainWindow):
     def __init__(self):
         super().__init__()
         SQLiteHandler.init_db()
+        if SQLiteHandler.fetch_setting("diagnostics") == "1":
+            METRICS.enabled = True
         self.setWindowTitle("Менеджер ресурсов")
         self.setGeometry(300, 200, 900, 600)
 
         self.monitor = SystemMonitor()
-        self.last_net = net_io_counters()
-        self.logged_data = []
+        self.row_builder = RowBuilder()
+        self.detector = AnomalyDetector.from_settings(SQLiteHandler.fetch_settings())
+        self.logged_data = SampleBuffer(history_size_setting())
+        self.live_data = None
+        self.imported_saved = False
+        self.file_worker = None
         self.live_mode = True
+        # порядковый номер показания для UsageWriter и журнала; не зависит от того, какой буфер на экране
+        self.sample_seq = 0
         self.hardware_info = {}
-
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update_stats)
-        self.timer.start(5000)
+        # под каким хостом пишутся показания: в режиме воспроизведения — REPLAY_HOST
+        self.sample_host = LOCAL_HOST
+        self.replayer = None
+        self.replay_timer = QTimer(self)
+        self.replay_timer.timeout.connect(self.show_replay_report)
 
         self.init_ui()
+        self.refresh_hosts()
         self.load_hardware_from_db()
         self.load_avatar()
 
+        try:
+            self.journal = Journal(journal_path(SQLiteHandler.DB_FILE, "gui"))
+        except JournalLocked:
+            # окно уже открыто в другом процессе: его журнал не трогаем, этот экземпляр работает без журнала
+            self.journal = None
+            self.statusBar().showMessage("Журнал занят другим экземпляром программы — работа без журнала", 10000)
+        else:
+            if self.journal.rotated:
+                self.statusBar().showMessage(
+                    f"Журнал повреждён и отложен в {self.journal.rotated}, начат новый", 10000
+                )
+            elif self.journal.restored:
+                self.statusBar().showMessage(
+                    f"Восстановлено показаний после аварийного завершения: {self.journal.restored}", 10000
+                )
+        retention_days = SQLiteHandler.fetch_retention_days()
+        self.writer = UsageWriter(retention_days=retention_days, journal=self.journal)
+        self.writer.start()
+
+        self.bridge = SampleBridge()
+        self.bridge.sample_ready.connect(self.update_stats)
+        self.collector = Collector(self.monitor, self.bridge.sample_ready.emit, consumers=USED_COMPONENTS)
+        self.collector.start()
+
+        self.api_snapshot = Snapshot()
+        self.api_server = None
+        self.start_api()
+
+    def start_api(self):
+        """(Пере)запускает HTTP-сервер по настройке http_address (хост:порт); "off" или пусто — выключен"""
+        if self.api_server is not None:
+            self.api_server.stop()
+            self.api_server = None
+        address = SQLiteHandler.fetch_setting("http_address", "")
+        if not address or address == "off":
+            return
+        try:
+            self.api_server = ApiServer(self.api_snapshot, address)
+        except (OSError, ValueError) as e:
+            self.statusBar().showMessage(f"HTTP-сервер не запущен ({address}): {e}", 10000)
+            return
+        self.api_server.start()
+        self.statusBar().showMessage(f"HTTP: http://{self.api_server.address}/api/current", 10000)
+
+    def closeEvent(self, event):
+        if self.replayer is not None:
+            self.replayer.stop()
+        self.collector.stop()
+        self.monitor.close()
+        if self.api_server is not None:
+            self.api_server.stop()
+        self.writer.stop()
+        # поток записи, не успевший завершиться, ещё отмечает пачки в журнале — отображение не закрываем
+        if self.journal is not None and not self.writer.is_alive():
+            self.journal.close()
+        self.history_tab.loader.stop()
+        if self.file_worker is not None:
+            self.file_worker.cancel.set()
+            self.file_worker.wait()
+        super().closeEvent(event)
+
     def init_ui(self):
         self.tabs = QTabWidget()
         self.cpu_tab = SystemTab("Процессор", "Загрузка, %")
         self.mem_tab = SystemTab("Оперативная память", "Использование, %")
         self.gpu_tab = SystemTab("Видеокарта", "Загрузка, %")
         self.net_tab = SystemTab("Сеть", "Передача, КБ/с")
+        self.disk_io_tab = RateTab(
+            [("read_kb_s", "Чтение", "КБ/с"), ("write_kb_s", "Запись", "КБ/с")],
+            lambda rates: f"Операций в секунду: чтение {rates['read_iops']:.0f}, запись {rates['write_iops']:.0f}",
+        )
+        self.nic_tab = RateTab([("recv_kb_s", "Приём", "КБ/с"), ("sent_kb_s", "Отправка", "КБ/с")])
+        self.process_tab = ProcessTab()
         self.settings_tab = self.create_settings_tab()
         self.hardware_tab = self.create_hardware_tab()
         self.profile_tab = self.create_profile_tab()
+        self.stats_tab = StatsTab()
+        self.history_tab = HistoryTab()
+        self.diagnostics_tab = DiagnosticsTab()
+        self.alerts_tab = AlertsTab()
+        self.alerts_tab.add(reversed(SQLiteHandler.fetch_alerts(AlertsTab.MAX_ROWS)))
 
         self.tabs.addTab(self.cpu_tab, "Процессор")
         self.tabs.addTab(self.mem_tab, "ОЗУ")
         self.tabs.addTab(self.gpu_tab, "GPU")
         self.tabs.addTab(self.net_tab, "Сеть")
+        self.tabs.addTab(self.disk_io_tab, "Диски")
+        self.tabs.addTab(self.nic_tab, "Интерфейсы")
+        self.tabs.addTab(self.process_tab, "Процессы")
+        self.tabs.addTab(self.stats_tab, "Статистика")
+        self.tabs.addTab(self.history_tab, "История")
         self.tabs.addTab(self.settings_tab, "Настройки")
         self.tabs.addTab(self.hardware_tab, "Оборудование")
         self.tabs.addTab(self.profile_tab, "Профиль")
+        self.tabs.addTab(self.diagnostics_tab, "Диагностика")
+        self.tabs.addTab(self.alerts_tab, "Оповещения")
+        self.metric_tabs = {
+            "cpu": self.cpu_tab,
+            "memory": self.mem_tab,
+            "gpu": self.gpu_tab,
+            "network_kb": self.net_tab,
+        }
+        self.tabs.currentChanged.connect(self.refresh_visible_tab)
 
         self.export_button = QPushButton("Экспорт CSV")
         self.export_button.clicked.connect(self.export_csv)
@@ -109,15 +786,44 @@ class SystemInfoApp(QMainWindow):
         self.import_button.clicked.connect(self.import_csv)
         self.save_db_button = QPushButton("Сохранить в БД")
         self.save_db_button.clicked.connect(self.save_to_db)
+        self.report_button = QPushButton("Отчёт")
+        self.report_button.clicked.connect(self.export_report)
         self.live_button = QPushButton("Live режим")
         self.live_button.clicked.connect(self.return_to_live)
+        self.host_box = QComboBox()
+        self.host_box.currentTextChanged.connect(self.select_host)
+        self.refresh_hosts_button = QPushButton("Обновить список хостов")
+        self.refresh_hosts_button.clicked.connect(self.refresh_hosts)
+        host_layout = QHBoxLayout()
+        host_layout.addWidget(QLabel("Хост:"))
+        host_layout.addWidget(self.host_box, 1)
+        host_layout.addWidget(self.refresh_hosts_button)
+
+        self.replay_source_box = QComboBox()
+        self.replay_source_box.addItem("Синтетические данные", "synthetic")
+        self.replay_source_box.addItem("БД за последние сутки", "db")
+        self.replay_source_box.addItem("Файл CSV / .smp...", "file")
+        self.replay_speed_box = QComboBox()
+        for speed in SPEEDS:
+            self.replay_speed_box.addItem(f"{speed}x", speed)
+        self.replay_speed_box.addItem("Без пауз", 0)
+        self.replay_button = QPushButton("Воспроизвести")
+        self.replay_button.clicked.connect(self.toggle_replay)
+        replay_layout = QHBoxLayout()
+        replay_layout.addWidget(QLabel("Воспроизведение:"))
+        replay_layout.addWidget(self.replay_source_box, 1)
+        replay_layout.addWidget(self.replay_speed_box)
+        replay_layout.addWidget(self.replay_button)
 
         layout = QVBoxLayout()
+        layout.addLayout(host_layout)
         layout.addWidget(self.tabs)
         layout.addWidget(self.export_button)
         layout.addWidget(self.import_button)
         layout.addWidget(self.save_db_button)
+        layout.addWidget(self.report_button)
         layout.addWidget(self.live_button)
+        layout.addLayout(replay_layout)
 
         container = QWidget()
         container.setLayout(layout)
@@ -271,6 +977,10 @@ class SystemInfoApp(QMainWindow):
             QMessageBox.warning(self, "Ошибка", "Введите имя и значение настройки!")
             return
         SQLiteHandler.insert_setting(name, value)
+        if name.startswith("alert_"):
+            self.detector = AnomalyDetector.from_settings(SQLiteHandler.fetch_settings())
+        if name == "http_address":
+            self.start_api()
         QMessageBox.information(self, "OK", "Настройка сохранена!")
 
     def load_hardware_from_db(self):
@@ -289,106 +999,241 @@ class SystemInfoApp(QMainWindow):
         cpu_title = f"Процессор ({self.hardware_info.get('cpu', '')})" if self.hardware_info.get("cpu") else "Процессор"
         gpu_title = f"Видеокарта ({self.hardware_info.get('gpu', '')})" if self.hardware_info.get(
             "gpu") else "Видеокарта"
-        self.cpu_tab.plot.ax.set_title(cpu_title)
-        self.gpu_tab.plot.ax.set_title(gpu_title)
+        self.cpu_tab.plot.set_title(cpu_title)
+        self.gpu_tab.plot.set_title(gpu_title)
         self.tabs.setTabText(0, cpu_title)
         self.tabs.setTabText(2, gpu_title)
-        self.cpu_tab.plot.canvas.draw_idle()
-        self.gpu_tab.plot.canvas.draw_idle()
 
-    def update_stats(self):
+    def update_stats(self, timestamp, usage):
+        row = self.row_builder.build(usage)
+        if row is None:
+            return
+        # HTTP отдаёт текущие показания и тогда, когда в окне открыт импорт или история
+        if self.api_server is not None:
+            self.api_snapshot.update(timestamp, row, usage.get("stale", ()), self.sample_host)
+
+        # показания пишутся в журнал и БД и проверяются на аномалии на каждом тике; импорт или чужой хост
+        # на экране отключает только обновление графиков
+        self.sample_seq += 1
+        if self.journal is not None and self.sample_host == LOCAL_HOST:
+            self.journal.append(self.sample_seq, timestamp, row)
+        self.writer.put(self.sample_seq, dict(row, time=timestamp, host=self.sample_host))
+
+        alerts = self.detector.process(timestamp, row, self.sample_host)
+        if alerts:
+            # в БД их пишет поток записи: занятая база не должна ронять слот интерфейса
+            self.writer.put_alerts(alerts)
+            self.alerts_tab.add(alerts)
+            self.statusBar().showMessage("; ".join(f"{a['metric']}: {a['message']}" for a in alerts), 10000)
+        elif self.writer.error:
+            self.statusBar().showMessage(f"Ошибка записи в БД, показания ждут повтора: {self.writer.error}")
+        elif usage.get("stale"):
+            self.statusBar().showMessage(f"Нет свежих данных: {', '.join(usage['stale'])}")
+        elif self.statusBar().currentMessage().startswith(("Нет свежих данных", "Ошибка записи в БД")):
+            self.statusBar().clearMessage()
+
         if not self.live_mode:
             return
+        self.logged_data.append(timestamp, row)
+
+        METRICS.set_gauge("buffer.samples", len(self.logged_data))
+        METRICS.set_gauge("buffer.mb", self.logged_data.nbytes / 2 ** 20)
+
+        # рисуется только видимая вкладка, остальные догонят данные при переключении
+        with METRICS.timed("render.tick"):
+            for column, tab in self.metric_tabs.items():
+                if tab.isVisible():
+                    tab.update(self.logged_data.column(column, PLOT_WINDOW))
+                else:
+                    tab.stale = True
+            # компоненты скоростей опрашиваются реже тика: прошлое значение второй раз не добавляется
+            fresh = usage.get("fresh", ())
+            for tab, name, devices in ((self.disk_io_tab, "disk_io", usage.get("disk_io", {}).get("disks")),
+                                       (self.nic_tab, "network", usage["network"]["interfaces"])):
+                if devices and name in fresh:
+                    tab.append(timestamp, devices)
+                if tab.isVisible():
+                    tab.update()
+            if self.process_tab.isVisible() and "processes" in usage:
+                self.process_tab.update(usage["processes"])
+            if self.stats_tab.isVisible():
+                self.stats_tab.show_stats(self.logged_data)
+        if self.diagnostics_tab.isVisible():
+            self.diagnostics_tab.update()
+
+    def refresh_visible_tab(self, index):
+        tab = self.tabs.widget(index)
+        for column, metric_tab in self.metric_tabs.items():
+            if metric_tab is tab and tab.stale and self.live_mode:
+                tab.update(self.logged_data.column(column, PLOT_WINDOW))
+        if tab in (self.disk_io_tab, self.nic_tab):
+            tab.update()
+        if tab is self.stats_tab:
+            tab.show_stats(self.logged_data)
+
+    def run_file_task(self, title, func, filename, *args, on_done):
+        if self.file_worker is not None:
+            QMessageBox.warning(self, "Ошибка", "Дождитесь завершения текущей операции с файлом")
+            return
+
+        dialog = QProgressDialog(title, "Отмена", 0, 100, self)
+        dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        worker = FileWorker(func, filename, *args)
+        worker.progress.connect(dialog.setValue)
+        worker.done.connect(on_done)
+        worker.failed.connect(lambda message: QMessageBox.warning(self, "Ошибка файла", message))
+        worker.finished.connect(dialog.close)
+        worker.finished.connect(self.file_task_finished)
+        dialog.canceled.connect(worker.cancel.set)
+        self.file_worker = worker
+        worker.start()
 
-        usage = self.monitor.get_all_usage()
-        cpu_percent = usage["cpu"]["usage_percent"]
-        mem_percent = usage["memory"]["percent"]
-        gpu_load = self.get_gpu_load(usage["gpu"])
-        net_total = self.get_network_usage()
-
-        self.cpu_tab.update(cpu_percent)
-        self.mem_tab.update(mem_percent)
-        self.gpu_tab.update(gpu_load)
-        self.net_tab.update(net_total)
-
-        self.logged_data.append({
-            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "cpu": cpu_percent,
-            "memory": mem_percent,
-            "gpu": gpu_load,
-            "network_kb": net_total
-        })
-
-    def get_gpu_load(self, gpu_usage):
-        if isinstance(gpu_usage, list) and gpu_usage:
-            return gpu_usage[0].get("load_percent", 0)
-        if isinstance(gpu_usage, dict):
-            return gpu_usage.get("load_percent", 0)
-        return 0
-
-    def get_network_usage(self):
-        net = net_io_counters()
-        sent_kb = (net.bytes_sent - self.last_net.bytes_sent) / 1024
-        recv_kb = (net.bytes_recv - self.last_net.bytes_recv) / 1024
-        self.last_net = net
-        return sent_kb + recv_kb
+    def file_task_finished(self):
+        self.file_worker = None
+
+    def export_report(self):
+        filename, _ = QFileDialog.getSaveFileName(self, "Сохранить отчёт", "", "CSV Files (*.csv)")
+        if not filename:
+            return
+        # пороги те же, что у оповещений
+        thresholds = {m: threshold for m, (threshold, _) in self.detector.thresholds.items() if threshold is not None}
+        host = self.host_box.currentText() or LOCAL_HOST
+        self.run_file_task(
+            "Построение отчёта...", write_report, filename, host, thresholds,
+            on_done=lambda rows: QMessageBox.information(self, "OK", f"Отчёт сохранён, строк: {rows}")
+        )
 
     def export_csv(self):
-        filename, _ = QFileDialog.getSaveFileName(self, "Сохранить CSV", "", "CSV Files (*.csv)")
-        if filename:
-            with open(filename, mode="w", newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=["time", "cpu", "memory", "gpu", "network_kb"])
-                writer.writeheader()
-                writer.writerows(self.logged_data)
+        filename, _ = QFileDialog.getSaveFileName(self, "Сохранить данные", "", FILE_FILTER)
+        if not filename:
+            return
+        times, columns = self.logged_data.snapshot()
+        func = export_binary if filename.endswith(".smp") else export_csv
+        self.run_file_task("Экспорт данных...", func, filename, times, columns, on_done=lambda count: None)
 
     def import_csv(self):
-        filename, _ = QFileDialog.getOpenFileName(self, "Открыть CSV", "", "CSV Files (*.csv)")
+        filename, _ = QFileDialog.getOpenFileName(self, "Открыть данные", "", FILE_FILTER)
         if not filename:
             return
+        func = import_binary if filename.endswith(".smp") else import_csv
+        self.run_file_task("Импорт данных...", func, filename, on_done=self.show_imported)
 
-        imported_data = []
-        with open(filename, mode="r", newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                try:
-                    imported_data.append({
-                        "time": row["time"],
-                        "cpu": float(row["cpu"]),
-                        "memory": float(row["memory"]),
-                        "gpu": float(row["gpu"]),
-                        "network_kb": float(row["network_kb"])
-                    })
-                except ValueError as e:
-                    QMessageBox.warning(self, "Ошибка CSV", f"Некорректные данные в CSV: {e}")
-                    return
-
-        if not imported_data:
-            QMessageBox.warning(self, "Ошибка CSV", "Файл CSV пустой или некорректный")
+    def show_imported(self, result):
+        buffer, skipped = result
+        if not buffer:
+            QMessageBox.warning(self, "Ошибка CSV", "Файл пустой или некорректный")
             return
 
+        if self.live_mode:
+            self.live_data = self.logged_data
         self.live_mode = False
-        self.logged_data = imported_data
+        self.imported_saved = False
+        self.logged_data = buffer
+
+        with METRICS.timed("render.set_data"):
+            self.cpu_tab.set_data(self.logged_data.column("cpu"))
+            self.mem_tab.set_data(self.logged_data.column("memory"))
+            self.gpu_tab.set_data(self.logged_data.column("gpu"))
+            self.net_tab.set_data(self.logged_data.column("network_kb"))
+        if self.stats_tab.isVisible():
+            self.stats_tab.show_stats(self.logged_data)
 
-        self.cpu_tab.set_data([row["cpu"] for row in self.logged_data])
-        self.mem_tab.set_data([row["memory"] for row in self.logged_data])
-        self.gpu_tab.set_data([row["gpu"] for row in self.logged_data])
-        self.net_tab.set_data([row["network_kb"] for row in self.logged_data])
+        if skipped:
+            QMessageBox.warning(self, "Ошибка CSV", f"Пропущено строк с некорректными данными: {skipped}")
 
     def save_to_db(self):
-        if not self.logged_data:
+        if not self.live_mode and self.imported_saved:
+            QMessageBox.information(self, "OK", "Данные мониторинга сохранены в БД!")
             return
-        for row in self.logged_data:
-            SQLiteHandler.insert_usage(row)
+        # живые показания пишутся непрерывно, достаточно дождаться хвоста очереди; запись идёт в фоне,
+        # чтобы занятая БД (или идущая в UsageWriter чистка) не подвешивала окно
+        rows = None if self.live_mode else self.logged_data.rows()
+        self.run_file_task("Сохранение в БД...", save_samples, self.writer, rows, on_done=self.saved_to_db)
+
+    def saved_to_db(self, imported):
+        if imported:
+            self.imported_saved = True
         QMessageBox.information(self, "OK", "Данные мониторинга сохранены в БД!")
 
+    def refresh_hosts(self):
+        current = self.host_box.currentText() or LOCAL_HOST
+        hosts = [LOCAL_HOST] + [host for host in SQLiteHandler.fetch_hosts() if host != LOCAL_HOST]
+        self.host_box.blockSignals(True)
+        self.host_box.clear()
+        self.host_box.addItems(hosts)
+        self.host_box.setCurrentText(current if current in hosts else LOCAL_HOST)
+        self.host_box.blockSignals(False)
+
+    def select_host(self, host):
+        if not host:
+            return
+        self.history_tab.set_host(host)
+        if host == LOCAL_HOST:
+            self.return_to_live()
+            return
+        self.run_file_task("Загрузка показаний хоста...", load_host_samples, host, on_done=self.show_host)
+
+    def show_host(self, result):
+        self.show_imported(result)
+        # показания другого хоста уже лежат в БД, сохранять их повторно не нужно
+        self.imported_saved = True
+
     def return_to_live(self):
+        self.host_box.blockSignals(True)
+        self.host_box.setCurrentText(LOCAL_HOST)
+        self.host_box.blockSignals(False)
         self.live_mode = True
-        self.logged_data = []
+        if self.live_data is not None:
+            self.logged_data = self.live_data
+            self.live_data = None
+        self.logged_data.clear()
 
         self.cpu_tab.set_data([])
         self.mem_tab.set_data([])
         self.gpu_tab.set_data([])
         self.net_tab.set_data([])
+        self.stats_tab.show_stats(self.logged_data)
+
+    def toggle_replay(self):
+        if self.replayer is not None:
+            self.stop_replay()
+            return
+
+        spec = self.replay_source_box.currentData()
+        if spec == "file":
+            spec, _ = QFileDialog.getOpenFileName(self, "Файл для воспроизведения", "", FILE_FILTER)
+            if not spec:
+                return
+        # показания идут по обычному пути update_stats, но вместо опроса системы
+        self.collector.stop()
+        self.return_to_live()
+        self.sample_host = REPLAY_HOST
+        self.replayer = Replayer(open_source(spec), self.bridge.sample_ready.emit,
+                                 speed=self.replay_speed_box.currentData(), max_pending=PLOT_WINDOW)
+        # слоты вызываются в порядке подключения, поэтому processed срабатывает после update_stats
+        self.bridge.sample_ready.connect(self.replayer.processed)
+        self.replayer.start()
+        self.replay_timer.start(1000)
+        self.replay_button.setText("Остановить воспроизведение")
+
+    def stop_replay(self):
+        self.replay_timer.stop()
+        self.replayer.stop()
+        self.bridge.sample_ready.disconnect(self.replayer.processed)
+        self.show_replay_report()
+        self.replayer = None
+        self.sample_host = LOCAL_HOST
+        self.return_to_live()
+        self.collector = Collector(self.monitor, self.bridge.sample_ready.emit, consumers=USED_COMPONENTS)
+        self.collector.start()
+        self.replay_button.setText("Воспроизвести")
+
+    def show_replay_report(self):
+        report = self.replayer.report()
+        self.statusBar().showMessage(
+            f"Воспроизведение: {report['samples_per_sec']:.0f} показаний/с, обработано {report['processed']}, "
+            f"пропущено кадров {report['dropped']}" + (" — завершено" if report["finished"] else "")
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,145 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# верхние границы корзин гистограммы, миллисекунды
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+
+
+class Histogram:
+    """Гистограмма длительностей с фиксированными корзинами: O(log корзин) на наблюдение, память постоянна"""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value_ms):
+        with self._lock:
+            self.counts[bisect.bisect_left(BUCKETS_MS, value_ms)] += 1
+            self.count += 1
+            self.total += value_ms
+            self.min = min(self.min, value_ms)
+            self.max = max(self.max, value_ms)
+
+    def quantile(self, q):
+        """Оценка квантиля сверху — граница корзины, в которую он попал"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count,
+            "min_ms": self.min,
+            "max_ms": self.max,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+        }
+
+
+class Gauge:
+    """Последнее записанное значение"""
+
+    def __init__(self):
+        self.value = None
+
+    def set(self, value):
+        self.value = value
+
+    def snapshot(self):
+        return {"value": self.value}
+
+
+class _NoTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_TIMER = _NoTimer()
+
+
+class Metrics:
+    """Реестр метрик самого монитора.
+
+    Пока enabled ложно, timed() возвращает общий пустой контекст, а
+    observe() и set_gauge() выходят после одной проверки, так что
+    выключенные замеры почти ничего не стоят.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def observe(self, name, value_ms):
+        if self.enabled:
+            self.histogram(name).observe(value_ms)
+
+    def set_gauge(self, name, value):
+        if self.enabled:
+            gauge = self.gauges.get(name)
+            if gauge is None:
+                with self._lock:
+                    gauge = self.gauges.setdefault(name, Gauge())
+            gauge.set(value)
+
+    def timed(self, name):
+        """Контекстный менеджер, записывающий длительность блока в гистограмму name"""
+        if not self.enabled:
+            return _NO_TIMER
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram(name).observe((time.perf_counter() - start) * 1e3)
+
+    def snapshot(self):
+        return {
+            "histograms": {name: h.snapshot() for name, h in sorted(self.histograms.items())},
+            "gauges": {name: g.snapshot()["value"] for name, g in sorted(self.gauges.items())},
+        }
+
+    def dump(self, filename):
+        """Сохраняет снимок всех метрик в JSON"""
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(dict(self.snapshot(), time=time.time()), f, indent=2, ensure_ascii=False)
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.gauges.clear()
+
+
+METRICS = Metrics(enabled=os.environ.get("SYSMON_METRICS") == "1")
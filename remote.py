@@ -0,0 +1,349 @@
+import argparse
+import asyncio
+import os
+import socket
+import struct
+import threading
+from collections import OrderedDict, deque
+
+from alerts import AnomalyDetector
+from db import SQLiteHandler, UsageWriter
+from metrics import METRICS
+
+# Кадр: магия, версия, тип, длина полезной нагрузки (сетевой порядок байт)
+FRAME = struct.Struct("!2sBBI")
+MAGIC = b"SM"
+VERSION = 1
+HELLO, BATCH, ACK = 1, 2, 3
+# HELLO: идентификатор сеанса агента и имя хоста в UTF-8
+HELLO_HEADER = struct.Struct("!Q")
+# BATCH: порядковый номер пачки, затем записи; ACK: номер подтверждённой пачки
+SEQ = struct.Struct("!Q")
+# запись показания: время (секунды эпохи) и четыре метрики float32 — 24 байта
+RECORD = struct.Struct("<q4f")
+MAX_PAYLOAD = 16 * 2 ** 20
+# сколько сеансов агентов сборщик помнит для отсева повторных пачек
+MAX_SESSIONS = 4096
+
+
+class ProtocolError(Exception):
+    """Поток байт не похож на кадры протокола агента"""
+
+
+def parse_address(address):
+    """
+    :param address: "unix:/путь/к/сокету" или "хост:порт"
+    :return: ("unix", путь) или ("tcp", (хост, порт))
+    """
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Ожидался адрес вида хост:порт или unix:путь, получено: {address}")
+    return "tcp", (host, int(port))
+
+
+def encode_frame(frame_type, payload):
+    return FRAME.pack(MAGIC, VERSION, frame_type, len(payload)) + payload
+
+
+def encode_hello(session, host):
+    return encode_frame(HELLO, HELLO_HEADER.pack(session) + host.encode("utf-8"))
+
+
+def encode_batch(seq, rows):
+    payload = bytearray(SEQ.pack(seq))
+    for row in rows:
+        payload += RECORD.pack(int(row["time"]), row["cpu"], row["memory"], row["gpu"], row["network_kb"])
+    return encode_frame(BATCH, bytes(payload))
+
+
+def decode_hello(payload):
+    """:return: (идентификатор сеанса, имя хоста)"""
+    if len(payload) < HELLO_HEADER.size:
+        raise ProtocolError("Кадр HELLO короче заголовка")
+    (session,) = HELLO_HEADER.unpack_from(payload)
+    return session, payload[HELLO_HEADER.size:].decode("utf-8")
+
+
+def decode_batch(payload, host):
+    """:return: (номер пачки, список строк для SQLiteHandler.insert_usage_many)"""
+    if len(payload) < SEQ.size:
+        raise ProtocolError("Кадр BATCH короче номера пачки")
+    (seq,) = SEQ.unpack_from(payload)
+    body = memoryview(payload)[SEQ.size:]
+    if len(body) % RECORD.size:
+        raise ProtocolError("Длина пачки не кратна размеру записи")
+    rows = [
+        {"host": host, "time": t, "cpu": cpu, "memory": memory, "gpu": gpu, "network_kb": net}
+        for t, cpu, memory, gpu, net in RECORD.iter_unpack(body)
+    ]
+    return seq, rows
+
+
+def parse_header(header):
+    magic, version, frame_type, length = FRAME.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise ProtocolError("Неизвестная сигнатура или версия кадра")
+    if length > MAX_PAYLOAD:
+        raise ProtocolError("Слишком большой кадр")
+    return frame_type, length
+
+
+class Agent(threading.Thread):
+    """Отправляет показания центральному сборщику пачками по TCP или Unix-сокету.
+
+    Пачка уходит, когда набралось batch_size строк или прошло flush_interval
+    секунд. Собранная пачка забирается из очереди и хранится отдельно, пока
+    сборщик её не подтвердит: при обрыве соединения агент переподключается и
+    повторяет ровно тот же кадр, а сборщик отбрасывает повторы по номеру
+    пачки. Если сборщик долго недоступен, в очереди хранится не больше
+    max_pending последних строк (не считая отправляемой пачки).
+    """
+
+    RECONNECT_DELAY = 1.0
+    MAX_RECONNECT_DELAY = 30.0
+
+    def __init__(self, address, host, batch_size=100, flush_interval=1.0, max_pending=100_000, timeout=5.0):
+        super().__init__(name="agent", daemon=True)
+        self.address = parse_address(address)
+        self.host = host
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.session = int.from_bytes(os.urandom(8), "big")
+        self.seq = 0
+        self.sent_rows = 0
+        self._pending = deque(maxlen=max_pending)
+        # (номер, кадр, число строк) отправленной, но ещё не подтверждённой пачки
+        self._in_flight = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._socket = None
+
+    def put(self, row):
+        with self._lock:
+            self._pending.append(row)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def stop(self, timeout=5.0):
+        """Отправляет остаток очереди (если сборщик доступен) и останавливает поток"""
+        self._stop_event.set()
+        self._wakeup.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        delay = self.RECONNECT_DELAY
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            stopping = self._stop_event.is_set()
+            try:
+                while self._send_batch():
+                    pass
+                delay = self.RECONNECT_DELAY
+            except (OSError, ProtocolError):
+                self._close()
+                if stopping:
+                    break
+                self._stop_event.wait(delay)
+                delay = min(delay * 2, self.MAX_RECONNECT_DELAY)
+            if stopping:
+                break
+        self._close()
+
+    def _send_batch(self):
+        """Отправляет одну пачку и ждёт подтверждения; возвращает True, если в очереди ещё что-то осталось"""
+        if self._in_flight is None:
+            with self._lock:
+                rows = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            if not rows:
+                return False
+            seq = self.seq + 1
+            self._in_flight = (seq, encode_batch(seq, rows), len(rows))
+        seq, frame, count = self._in_flight
+
+        sock = self._connect()
+        sock.sendall(frame)
+        frame_type, length = parse_header(self._recv_exactly(FRAME.size))
+        if frame_type != ACK or length != SEQ.size:
+            raise ProtocolError("Ожидался кадр ACK")
+        (acked,) = SEQ.unpack(self._recv_exactly(length))
+        if acked != seq:
+            raise ProtocolError("Сборщик подтвердил не ту пачку")
+
+        self.seq = seq
+        self.sent_rows += count
+        self._in_flight = None
+        with self._lock:
+            return len(self._pending) > 0
+
+    def _connect(self):
+        if self._socket is None:
+            kind, target = self.address
+            if kind == "unix":
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(self.timeout)
+                sock.connect(target)
+            else:
+                sock = socket.create_connection(target, timeout=self.timeout)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.sendall(encode_hello(self.session, self.host))
+            self._socket = sock
+        return self._socket
+
+    def _recv_exactly(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self._socket.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("Сборщик закрыл соединение")
+            data += chunk
+        return bytes(data)
+
+    def _close(self):
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+            self._socket = None
+
+
+class CollectorServer:
+    """Центральный сборщик на asyncio: принимает пачки агентов и складывает их в SQLite через UsageWriter.
+
+    Пачка подтверждается (ACK) только после того, как UsageWriter записал её
+    в БД, поэтому подтверждённые показания не теряются и при падении сборщика.
+    Для каждого сеанса агента запоминается номер последней принятой пачки,
+    поэтому повторно присланная после обрыва пачка подтверждается, но не
+    записывается второй раз. Помнятся только MAX_SESSIONS сеансов, от
+    которых пачки приходили последними.
+    """
+
+    def __init__(self, writer, detector=None):
+        self.writer = writer
+        self.detector = detector
+        self.received_rows = 0
+        self._seq = 0
+        self._last_batch = OrderedDict()
+        self._server = None
+        # открытые соединения агентов: writer -> задача, которая его обслуживает
+        self._connections = {}
+
+    async def start(self, address):
+        kind, target = parse_address(address)
+        if kind == "unix":
+            if os.path.exists(target):
+                os.unlink(target)
+            self._server = await asyncio.start_unix_server(self.handle, path=target)
+        else:
+            self._server = await asyncio.start_server(self.handle, *target)
+        return self._server
+
+    async def close(self, timeout=5.0):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        # обработчики, ждущие следующего кадра, завершаются на ошибке чтения из закрытого сокета
+        for writer in list(self._connections):
+            writer.close()
+        if self._connections:
+            await asyncio.wait(list(self._connections.values()), timeout=timeout)
+
+    @staticmethod
+    def _on_commit(loop, committed):
+        """Колбэк для UsageWriter.put_many: из потока записи завершает future в цикле событий"""
+        def resolve():
+            if not committed.done():
+                committed.set_result(None)
+
+        def on_commit():
+            try:
+                loop.call_soon_threadsafe(resolve)
+            except RuntimeError:
+                # цикл событий уже закрыт — подтверждать некому
+                pass
+
+        return on_commit
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        self._connections[writer] = asyncio.current_task()
+        try:
+            frame_type, length = parse_header(await reader.readexactly(FRAME.size))
+            if frame_type != HELLO:
+                raise ProtocolError("Первым кадром должен быть HELLO")
+            session, host = decode_hello(await reader.readexactly(length))
+
+            while True:
+                frame_type, length = parse_header(await reader.readexactly(FRAME.size))
+                payload = await reader.readexactly(length)
+                if frame_type != BATCH:
+                    raise ProtocolError("Ожидался кадр BATCH")
+                seq, rows = decode_batch(payload, host)
+                last_seq, committed = self._last_batch.get((host, session), (0, None))
+                if seq > last_seq:
+                    committed = loop.create_future()
+                    self._last_batch[(host, session)] = (seq, committed)
+                    self._last_batch.move_to_end((host, session))
+                    while len(self._last_batch) > MAX_SESSIONS:
+                        self._last_batch.popitem(last=False)
+                    self._seq += 1
+                    self.writer.put_many(self._seq, rows, self._on_commit(loop, committed))
+                    self.received_rows += len(rows)
+                    METRICS.set_gauge("remote.received_rows", self.received_rows)
+                    if self.detector is not None:
+                        # оповещения пишет в БД поток UsageWriter, цикл событий на SQLite не ждёт
+                        self.writer.put_alerts(
+                            [a for row in rows for a in self.detector.process(row["time"], row, host)]
+                        )
+                if seq >= last_seq and committed is not None:
+                    # повтор ещё не записанной пачки ждёт ту же запись; shield — обрыв одного соединения
+                    # не отменяет ожидание для остальных
+                    await asyncio.shield(committed)
+                writer.write(encode_frame(ACK, SEQ.pack(seq)))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ProtocolError, UnicodeDecodeError):
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Центральный сборщик показаний от агентов (headless.py --push)")
+    parser.add_argument("--listen", default="127.0.0.1:9100", help="хост:порт или unix:путь")
+    parser.add_argument("--db", default=SQLiteHandler.DB_FILE, help="Путь к файлу базы данных")
+    return parser.parse_args(argv)
+
+
+async def serve(args):
+    SQLiteHandler.DB_FILE = args.db
+    SQLiteHandler.init_db()
+    retention_days = SQLiteHandler.fetch_retention_days()
+    # агент ждёт подтверждения пачки, а оно уходит только после записи: короткий интервал сброса держит задержку
+    writer = UsageWriter(batch_size=5000, flush_interval=0.1, retention_days=retention_days)
+    writer.start()
+    server = CollectorServer(writer, AnomalyDetector.from_settings(SQLiteHandler.fetch_settings()))
+    await server.start(args.listen)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+        writer.stop()
+
+
+def main(argv=None):
+    try:
+        asyncio.run(serve(parse_args(argv)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import math
+import threading
+import time
+
+from db import LOCAL_HOST, USAGE_COLUMNS, SQLiteHandler
+from metrics import METRICS
+
+# хост, под которым воспроизведённые показания пишутся в БД, чтобы не смешиваться с настоящими
+REPLAY_HOST = "replay"
+SPEEDS = (1, 10, 100, 1000)
+
+
+def usage_from_row(row):
+    """Показание в том виде, в каком его отдаёт Collector, чтобы RowBuilder и интерфейс не отличали повтор"""
+    return {
+        "cpu": {"usage_percent": row["cpu"]},
+        "memory": {"percent": row["memory"]},
+        "gpu": [{"load_percent": row["gpu"]}],
+        # направление в записи не сохраняется: сумма делится поровну, чтобы RowBuilder получил тот же network_kb,
+        # а по интерфейсам данных нет вовсе — вкладка «Интерфейсы» при повторе пуста
+        "network": {"sent_kb_s": row["network_kb"] / 2, "recv_kb_s": row["network_kb"] / 2, "interfaces": {}},
+        "stale": [],
+    }
+
+
+def synthetic_samples(count=None, start=None, step=1.0):
+    """Бесконечный (или из count показаний) ряд синусоид с шагом step секунд, начиная с текущего времени"""
+    start = time.time() if start is None else start
+    i = 0
+    while count is None or i < count:
+        phase = i / 60
+        yield start + i * step, {
+            "cpu": 50 + 40 * math.sin(phase),
+            "memory": 60 + 10 * math.cos(phase / 7),
+            "gpu": 30 + 30 * math.sin(phase / 3),
+            "network_kb": abs(500 * math.sin(phase * 5)),
+        }
+        i += 1
+
+
+def file_samples(filename):
+    """Показания из CSV или .smp; файл читается целиком функциями fileio"""
+    from fileio import import_binary, import_csv
+
+    buffer, _ = (import_binary if filename.endswith(".smp") else import_csv)(filename)
+    times, columns = buffer.snapshot()
+    values = [columns[name].tolist() for name in USAGE_COLUMNS]
+    for timestamp, *row in zip(times.tolist(), *values):
+        yield timestamp, dict(zip(USAGE_COLUMNS, row))
+
+
+def db_samples(start, end, host=LOCAL_HOST):
+    """Показания хоста из system_usage с start <= time < end, читаемые курсором по мере воспроизведения"""
+    for timestamp, *values in SQLiteHandler.fetch_usage_range(start, end, host=host):
+        yield timestamp, dict(zip(USAGE_COLUMNS, values))
+
+
+def open_source(spec):
+    """
+    :param spec: "synthetic", "db" (последние сутки этой машины), "db:<хост>" или путь к .csv/.smp
+    :return: Итератор пар (time, строка показаний)
+    """
+    if spec == "synthetic":
+        return synthetic_samples()
+    if spec == "db" or spec.startswith("db:"):
+        end = int(time.time()) + 1
+        return db_samples(end - 86400, end, spec[3:] or LOCAL_HOST)
+    return file_samples(spec)
+
+
+class Replayer(threading.Thread):
+    """Подменяет Collector: отдаёт записанные или синтетические показания в тот же callback в ускоренном темпе.
+
+    Показание с временем t отправляется через (t - t0) / speed секунд после
+    старта; speed=0 — без пауз, так быстро, как примет получатель. Если
+    задан max_pending, получатель (интерфейс) сообщает об обработке каждого
+    показания через processed(); пока необработанных max_pending, новые
+    показания не ставятся в очередь, а считаются пропущенными кадрами
+    (при speed=0 воспроизведение вместо этого ждёт получателя).
+    Без max_pending callback считается синхронным.
+    """
+
+    def __init__(self, samples, callback, speed=1.0, max_pending=None):
+        super().__init__(name="replayer", daemon=True)
+        self.samples = samples
+        self.callback = callback
+        self.speed = speed
+        self.max_pending = max_pending
+        self.emitted = 0
+        self.processed_count = 0
+        self.dropped = 0
+        self.started_at = None
+        self.finished_at = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        self.started_at = time.monotonic()
+        first = None
+        for timestamp, row in self.samples:
+            if self._stop_event.is_set():
+                break
+            if first is None:
+                first = timestamp
+            if self.speed:
+                delay = self.started_at + (timestamp - first) / self.speed - time.monotonic()
+                if delay > 0 and self._stop_event.wait(delay):
+                    break
+            if self.max_pending is not None:
+                if not self.speed:
+                    # без пауз темп задаёт получатель: ждём его, а не теряем показания
+                    while self.emitted - self.processed_count >= self.max_pending:
+                        if self._stop_event.wait(0.001):
+                            break
+                elif self.emitted - self.processed_count >= self.max_pending:
+                    self.dropped += 1
+                    continue
+            if self._stop_event.is_set():
+                break
+            self.emitted += 1
+            self.callback(timestamp, usage_from_row(row))
+            if self.max_pending is None:
+                self.processed_count += 1
+        self.finished_at = time.monotonic()
+
+    def processed(self, *args):
+        """Слот для сигнала с показанием: вызывается получателем после обработки очередного показания"""
+        self.processed_count += 1
+
+    def report(self):
+        """Достигнутая скорость и потери с начала воспроизведения"""
+        elapsed = ((self.finished_at or time.monotonic()) - self.started_at) if self.started_at else 0
+        report = {
+            "elapsed_s": elapsed,
+            "emitted": self.emitted,
+            "processed": self.processed_count,
+            "dropped": self.dropped,
+            "samples_per_sec": self.processed_count / elapsed if elapsed else 0.0,
+            "finished": self.finished_at is not None,
+        }
+        METRICS.set_gauge("replay.samples_per_sec", report["samples_per_sec"])
+        METRICS.set_gauge("replay.dropped", self.dropped)
+        return report
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
@@ -0,0 +1,142 @@
+import numpy as np
+
+# сводные показатели, которые считает SampleBuffer.stats
+STATS = ("count", "min", "max", "mean", "p50", "p95", "p99")
+
+
+class SampleBuffer:
+    """Кольцевой буфер показаний фиксированной ёмкости: по одному столбцу numpy на метрику.
+
+    Каждое значение записывается дважды — в позицию i и i + capacity, поэтому
+    последние N значений любого столбца всегда лежат в памяти непрерывно и
+    отдаются графикам срезом без копирования.
+    """
+
+    COLUMNS = ("cpu", "memory", "gpu", "network_kb")
+    # проценты и КБ/с не требуют больше 7 значащих цифр, а float32 вдвое экономит память
+    DTYPE = np.float32
+
+    def __init__(self, capacity, columns=COLUMNS, dtype=DTYPE):
+        if capacity <= 0:
+            raise ValueError("Ёмкость буфера должна быть положительной")
+        self.capacity = capacity
+        self.columns = tuple(columns)
+        self._time = np.zeros(2 * capacity, dtype=np.int64)
+        self._data = {name: np.zeros(2 * capacity, dtype=dtype) for name in self.columns}
+        self._head = 0
+        self.size = 0
+        self.total = 0
+
+    @classmethod
+    def from_arrays(cls, times, columns, capacity=None):
+        """Создаёт буфер, заполненный готовыми массивами, без поштучных append.
+
+        Заполняется только первая половина хранилища: при полном буфере и
+        нулевой голове окно последних значений целиком лежит в ней, а
+        зеркальные ячейки понадобятся лишь для перезаписанных позже слотов.
+        """
+        count = len(times)
+        buffer = cls(capacity or max(count, 1), columns.keys())
+        count = min(count, buffer.capacity)
+        start = buffer.capacity - count
+        buffer._time[start:buffer.capacity] = times[len(times) - count:]
+        for name, values in columns.items():
+            buffer._data[name][start:buffer.capacity] = values[len(values) - count:]
+        buffer.size = count
+        buffer.total = count
+        return buffer
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        """Память, занятая столбцами буфера"""
+        return self._time.nbytes + sum(column.nbytes for column in self._data.values())
+
+    def append(self, timestamp, values):
+        """Добавляет одно показание за O(1); при переполнении вытесняется самое старое"""
+        i = self._head
+        j = i + self.capacity
+        self._time[i] = self._time[j] = int(timestamp)
+        for name, column in self._data.items():
+            column[i] = column[j] = values.get(name, 0)
+        self._head = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.total += 1
+
+    def _window(self, count):
+        count = self.size if count is None else min(count, self.capacity)
+        end = self._head + self.capacity
+        return slice(end - count, end)
+
+    def column(self, name, count=None):
+        """Последние count значений столбца в хронологическом порядке (срез без копирования).
+
+        Если count больше числа накопленных показаний, в начале окна будут нули.
+        """
+        return self._data[name][self._window(count)]
+
+    def times(self, count=None):
+        return self._time[self._window(count)]
+
+    def time_window(self, start=None, end=None):
+        """
+        Границы показаний с start <= time < end внутри накопленного окна; время растёт,
+        поэтому хватает searchsorted
+        """
+        times = self._time[self._window(None)]
+        lo = 0 if start is None else int(np.searchsorted(times, start, side="left"))
+        hi = len(times) if end is None else int(np.searchsorted(times, end, side="left"))
+        return lo, max(lo, hi)
+
+    def stats(self, start=None, end=None, columns=None):
+        """
+        Сводка по показаниям за [start, end) без циклов по значениям
+
+        :return: {столбец: {"count", "min", "max", "mean", "p50", "p95", "p99"}};
+                 для пустого окна все показатели, кроме count, равны None
+        """
+        lo, hi = self.time_window(start, end)
+        window = self._window(None)
+        result = {}
+        for name in columns or self.columns:
+            values = self._data[name][window][lo:hi]
+            if not len(values):
+                result[name] = dict(dict.fromkeys(STATS), count=0)
+                continue
+            p50, p95, p99 = np.percentile(values, (50, 95, 99))
+            result[name] = {
+                "count": len(values),
+                "min": float(values.min()),
+                "max": float(values.max()),
+                # среднее float32 накапливается в float64, чтобы не терять точность на миллионах значений
+                "mean": float(values.mean(dtype=np.float64)),
+                "p50": float(p50),
+                "p95": float(p95),
+                "p99": float(p99),
+            }
+        return result
+
+    def snapshot(self):
+        """Копия накопленных данных: (times, {имя: значения}), безопасная для передачи в другой поток"""
+        window = self._window(None)
+        return self._time[window].copy(), {name: self._data[name][window].copy() for name in self.columns}
+
+    def rows(self):
+        """Все накопленные показания от старых к новым в виде словарей"""
+        window = self._window(None)
+        times = self._time[window]
+        columns = [(name, self._data[name][window]) for name in self.columns]
+        for k in range(self.size):
+            row = {"time": int(times[k])}
+            for name, values in columns:
+                row[name] = float(values[k])
+            yield row
+
+    def clear(self):
+        self._time.fill(0)
+        for column in self._data.values():
+            column.fill(0)
+        self._head = 0
+        self.size = 0
@@ -0,0 +1,20 @@
+import os
+import sys
+
+# модули проекта лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from db import SQLiteHandler  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Пустая база во временном каталоге; путь к файлу"""
+    previous = SQLiteHandler.DB_FILE
+    SQLiteHandler.DB_FILE = str(tmp_path / "test.db")
+    SQLiteHandler.init_db()
+    yield SQLiteHandler.DB_FILE
+    SQLiteHandler.close_connection()
+    SQLiteHandler.DB_FILE = previous
@@ -0,0 +1,68 @@
+import zlib
+
+import numpy as np
+import pytest
+
+from archive import DTYPES, HEADER, QUANT, SERIES, decode_block, encode_block
+
+
+def series_codes(blob):
+    """Коды типов всех рядов блока по порядку"""
+    payload = zlib.decompress(blob)
+    offset = HEADER.size
+    codes = []
+    while offset < len(payload):
+        code, length = SERIES.unpack_from(payload, offset)
+        codes.append(code)
+        offset += SERIES.size + length
+    return codes
+
+
+def round_trip(times, columns):
+    decoded_times, decoded = decode_block(encode_block(times, columns), list(columns))
+    np.testing.assert_array_equal(decoded_times, times)
+    for name, values in columns.items():
+        np.testing.assert_allclose(decoded[name], values, atol=0.5 / QUANT, equal_nan=True)
+    return decoded
+
+
+def test_irregular_time_deltas():
+    # пропуски, повторы и скачки назад в разности разностей
+    times = np.array([1000, 1001, 1002, 1010, 1010, 1011, 5000, 5001, 5003, 5006])
+    round_trip(times, {"cpu": np.linspace(0, 100, len(times))})
+
+
+def test_negative_value_deltas():
+    values = np.array([100.0, 0.0, 99.99, -5.25, 50.5, 50.5, 0.01])
+    round_trip(np.arange(len(values)) + 10, {"cpu": values, "memory": values[::-1]})
+
+
+@pytest.mark.parametrize("step, dtype", [(0.5, "<i1"), (100.0, "<i2"), (1e6, "<i4"), (1e12, "<i8")])
+def test_each_dtype_width(step, dtype):
+    # разности соседних значений — до 2 * step * QUANT
+    values = np.array([0.0, step, -step, step])
+    times = np.arange(len(values))
+    round_trip(times, {"cpu": values})
+    # ряды: время, значения, номера пустых значений
+    assert DTYPES[series_codes(encode_block(times, {"cpu": values}))[1]] == dtype
+
+
+def test_single_sample():
+    round_trip(np.array([42]), {"cpu": np.array([12.34])})
+
+
+def test_nulls_round_trip():
+    values = np.array([np.nan, 1.0, np.nan, np.nan, 2.5, np.nan])
+    decoded = round_trip(np.arange(len(values)), {"gpu": values, "cpu": np.ones(len(values))})
+    assert np.isnan(decoded["gpu"]).sum() == 4
+    assert not np.isnan(decoded["cpu"]).any()
+
+
+def test_infinite_values_rejected():
+    with pytest.raises(ValueError):
+        encode_block(np.arange(2), {"cpu": np.array([1.0, np.inf])})
+
+
+def test_empty_block_rejected():
+    with pytest.raises(ValueError):
+        encode_block(np.array([], dtype=np.int64), {"cpu": np.array([])})
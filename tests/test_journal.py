@@ -0,0 +1,102 @@
+import os
+import sqlite3
+
+import pytest
+
+from db import SQLiteHandler, UsageWriter
+from journal import Journal, JournalLocked, journal_path
+
+
+def make_row(cpu):
+    return {"cpu": cpu, "memory": 50.0, "gpu": None, "network_kb": 1.0}
+
+
+def stored_rows():
+    return SQLiteHandler.get_connection().execute(
+        "SELECT time, cpu, gpu FROM system_usage WHERE cpu >= 1 ORDER BY time"
+    ).fetchall()
+
+
+@pytest.fixture
+def path(db):
+    return journal_path(db, "test")
+
+
+def test_restores_rows_not_committed(path):
+    journal = Journal(path, capacity=1000)
+    writer = UsageWriter(flush_interval=60.0, retention_days=0, journal=journal)
+    writer.start()
+    for seq in range(1, 11):
+        journal.append(seq, 1000 + seq, make_row(float(seq)))
+        writer.put(seq, dict(make_row(float(seq)), time=1000 + seq))
+    assert writer.flush(5)
+    writer.stop()
+    # эти показания в БД не попали: процесс «упал» до следующей пачки
+    for seq in range(11, 21):
+        journal.append(seq, 1000 + seq, make_row(float(seq)))
+    journal.close()
+
+    journal = Journal(path, capacity=1000)
+    assert journal.restored == 10
+    journal.close()
+    rows = stored_rows()
+    assert [t for t, _, _ in rows] == list(range(1001, 1021))
+    assert {gpu for _, _, gpu in rows} == {None}
+
+    # восстановленное второй раз не вставляется
+    journal = Journal(path, capacity=1000)
+    assert journal.restored == 0
+    journal.close()
+    assert len(stored_rows()) == 20
+
+
+def test_other_writer_under_same_host_does_not_mask_recovery(path):
+    journal = Journal(path, capacity=1000)
+    for seq in range(1, 101):
+        journal.append(seq, 2000 + seq, make_row(float(seq)))
+    journal.close()
+    # второй процесс за те же секунды под тем же хостом
+    SQLiteHandler.insert_usage_many([dict(make_row(0.0), time=2000 + k) for k in range(1, 101)])
+
+    journal = Journal(path, capacity=1000)
+    assert journal.restored == 100
+    journal.close()
+
+
+def test_second_instance_gets_journal_locked(path):
+    journal = Journal(path, capacity=100)
+    try:
+        with pytest.raises(JournalLocked):
+            Journal(path, capacity=100)
+    finally:
+        journal.close()
+
+
+def test_corrupt_file_rotated(path):
+    with open(path, "wb") as f:
+        f.write(b"not a journal" * 10)
+    journal = Journal(path, capacity=100)
+    journal.close()
+    assert journal.rotated is not None
+    assert journal.restored == 0
+    with open(journal.rotated, "rb") as f:
+        assert f.read().startswith(b"not a journal")
+
+
+def test_failed_recovery_releases_lock(path, monkeypatch):
+    journal = Journal(path, capacity=100)
+    journal.append(1, 1000, make_row(5.0))
+    journal.close()
+
+    def locked(name, session):
+        raise sqlite3.OperationalError("database is locked")
+
+    with monkeypatch.context() as m:
+        m.setattr(SQLiteHandler, "fetch_journal_seq", locked)
+        with pytest.raises(sqlite3.OperationalError):
+            Journal(path, capacity=100)
+    # файл не закрыт — блокировка осталась бы, и здесь был бы JournalLocked; записи не потеряны
+    journal = Journal(path, capacity=100)
+    assert journal.restored == 1
+    journal.close()
+    assert os.path.exists(path)
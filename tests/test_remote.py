@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from db import SQLiteHandler, UsageWriter
+from remote import ACK, BATCH, FRAME, HELLO, SEQ, Agent, CollectorServer, encode_batch, encode_frame, encode_hello
+
+
+def make_rows(start, n):
+    return [{"time": start + k, "cpu": 1.0, "memory": 2.0, "gpu": 3.0, "network_kb": 4.0} for k in range(n)]
+
+
+def stored(host="node"):
+    return SQLiteHandler.get_connection().execute(
+        "SELECT count(*) FROM system_usage WHERE host = ?", (host,)
+    ).fetchone()[0]
+
+
+@pytest.fixture
+def writer(db):
+    # длинный интервал сброса: подтверждение не должно прийти раньше записи
+    writer = UsageWriter(batch_size=5000, flush_interval=0.3, retention_days=0)
+    writer.start()
+    yield writer
+    writer.stop()
+
+
+async def start_server(writer):
+    server = CollectorServer(writer)
+    await server.start("127.0.0.1:0")
+    return server, server._server.sockets[0].getsockname()[1]
+
+
+async def send_batch(reader, writer, seq, rows):
+    writer.write(encode_batch(seq, rows))
+    await writer.drain()
+    header = await asyncio.wait_for(reader.readexactly(FRAME.size), 5)
+    frame_type, length = FRAME.unpack(header)[2:]
+    (acked,) = SEQ.unpack(await reader.readexactly(length))
+    return frame_type, acked
+
+
+def test_ack_after_commit_and_repeated_batch_dropped(writer):
+    async def scenario():
+        server, port = await start_server(writer)
+        reader, stream = await asyncio.open_connection("127.0.0.1", port)
+        stream.write(encode_hello(7, "node"))
+        assert await send_batch(reader, stream, 1, make_rows(1000, 50)) == (ACK, 1)
+        # подтверждённая пачка уже в БД
+        assert stored() == 50
+        assert await send_batch(reader, stream, 1, make_rows(1000, 50)) == (ACK, 1)
+        stream.close()
+
+        # переподключение с тем же сеансом: повтор отсекается и в новом соединении
+        reader, stream = await asyncio.open_connection("127.0.0.1", port)
+        stream.write(encode_hello(7, "node"))
+        assert await send_batch(reader, stream, 1, make_rows(1000, 50)) == (ACK, 1)
+        assert await send_batch(reader, stream, 2, make_rows(1050, 10)) == (ACK, 2)
+        stream.close()
+        await server.close()
+
+    asyncio.run(scenario())
+    assert stored() == 60
+
+
+@pytest.mark.parametrize("frames", [
+    encode_frame(HELLO, b"\x00\x01"),
+    encode_hello(1, "node") + encode_frame(BATCH, b"\x00"),
+    encode_hello(1, "node") + encode_frame(BATCH, b"\x00" * 8 + b"\x01"),
+], ids=["short hello", "short batch", "partial record"])
+def test_malformed_frames_close_connection(writer, frames):
+    async def scenario():
+        errors = []
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        server, port = await start_server(writer)
+        reader, stream = await asyncio.open_connection("127.0.0.1", port)
+        stream.write(frames)
+        assert await asyncio.wait_for(reader.read(), 5) == b""
+        stream.close()
+        await server.close()
+        return errors
+
+    assert asyncio.run(scenario()) == []
+
+
+def test_agent_delivers_all_rows(writer):
+    async def scenario():
+        server, port = await start_server(writer)
+        agent = Agent(f"127.0.0.1:{port}", "node", batch_size=100, flush_interval=0.05)
+        agent.start()
+        for row in make_rows(5000, 1000):
+            agent.put(row)
+        await asyncio.to_thread(agent.stop, 30)
+        await server.close()
+        return agent.sent_rows
+
+    assert asyncio.run(scenario()) == 1000
+    assert stored() == 1000
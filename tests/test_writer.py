@@ -0,0 +1,104 @@
+import sqlite3
+import threading
+
+import pytest
+
+from db import SQLiteHandler, UsageWriter
+
+
+def make_row(t, cpu=10.0, host="local"):
+    return {"time": t, "cpu": cpu, "memory": 50.0, "gpu": 0.0, "network_kb": 1.0, "host": host}
+
+
+def count(sql, *params):
+    return SQLiteHandler.get_connection().execute(sql, params).fetchone()[0]
+
+
+@pytest.fixture
+def writer(db):
+    # интервал сброса длинный: в тестах пачки пишутся по flush()
+    writer = UsageWriter(batch_size=1000, flush_interval=60.0, retention_days=0)
+    writer.RETRY_DELAY = 0.01
+    writer.start()
+    yield writer
+    writer.stop()
+
+
+def test_rows_and_rollups_written_on_flush(writer):
+    for k in range(120):
+        writer.put(k + 1, make_row(6000 + k, cpu=float(k)))
+    assert writer.flush(5)
+    assert count("SELECT count(*) FROM system_usage") == 120
+    assert count("SELECT count(*) FROM usage_1m") == 2
+    assert count("SELECT cpu_avg FROM usage_1m WHERE bucket = 6000") == pytest.approx(29.5)
+    assert count("SELECT count FROM usage_1h") == 120
+
+
+def test_repeated_seq_not_inserted_twice(writer):
+    writer.put(1, make_row(1000))
+    writer.put(1, make_row(1000))
+    writer.put_many(2, [make_row(1001), make_row(1002)])
+    writer.put_many(2, [make_row(1001), make_row(1002)])
+    assert writer.flush(5)
+    assert count("SELECT count(*) FROM system_usage") == 3
+
+
+def test_null_values_skipped_in_rollups(writer):
+    writer.put(1, make_row(1200, cpu=None))
+    writer.put(2, make_row(1201, cpu=30.0))
+    writer.put(3, make_row(1202, cpu=None))
+    assert writer.flush(5)
+    row = SQLiteHandler.get_connection().execute("SELECT count, cpu_min, cpu_max, cpu_avg FROM usage_1m").fetchone()
+    assert row == (3, 30.0, 30.0, 30.0)
+
+
+def test_failed_batch_kept_and_retried(writer, monkeypatch):
+    insert = SQLiteHandler.insert_usage_many
+    failures = []
+
+    def flaky(rows, journal=None):
+        if len(failures) < 3:
+            failures.append(len(rows))
+            raise sqlite3.OperationalError("database is locked")
+        insert(rows, journal)
+
+    monkeypatch.setattr(SQLiteHandler, "insert_usage_many", flaky)
+    writer.put(1, make_row(1000))
+    writer.put(2, make_row(1001))
+    assert writer.flush(5)
+    assert writer.is_alive()
+    assert writer.errors == 3
+    assert writer.error is None
+    assert count("SELECT count(*) FROM system_usage") == 2
+
+
+def test_flush_waits_while_database_fails(writer, monkeypatch):
+    def broken(rows, journal=None):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(SQLiteHandler, "insert_usage_many", broken)
+    writer.put(1, make_row(1000))
+    assert not writer.flush(0.2)
+    assert writer.error == "database is locked"
+    assert writer.is_alive()
+
+
+def test_on_commit_called_after_write(writer):
+    committed = threading.Event()
+    stored = []
+
+    def on_commit():
+        stored.append(count("SELECT count(*) FROM system_usage"))
+        committed.set()
+
+    writer.put_many(1, [make_row(1000), make_row(1001)], on_commit)
+    writer.flush(5)
+    assert committed.wait(5)
+    assert stored == [2]
+
+
+def test_alerts_written_with_batch(writer):
+    alert = {"time": 1000, "host": "local", "metric": "cpu", "kind": "threshold", "value": 99.0, "message": "cpu"}
+    writer.put_alerts([alert])
+    assert writer.flush(5)
+    assert SQLiteHandler.fetch_alerts() == [alert]